@@ -1,26 +1,68 @@
-from typing import Generator
-from fastapi import Depends, HTTPException, status
+import uuid
+from typing import Generator, Optional
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt, JWTError
+from jose import JWTError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.session import get_db
-from app.core.security import SECRET_KEY, ALGORITHM
+from app.core.security import access_token_cache
 from app.models.models import User
+from app.services.cart_service import CartService
 
 # Указываем FastAPI, где брать токен (URL для логина)
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl="/api/v1/auth/login"
 )
 
+# То же, но без 401 при отсутствии токена (гостевые корзины)
+optional_oauth2 = OAuth2PasswordBearer(
+    tokenUrl="/api/v1/auth/login",
+    auto_error=False,
+)
+
+GUEST_SESSION_KEY = "guest_id"
+
 async def get_current_user_id(
     token: str = Depends(reusable_oauth2)
 ) -> int:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=403, detail="Could not validate credentials")
-        return int(user_id)
+        # Проверенные токены кэшируются до их exp (см. AccessTokenCache)
+        return await access_token_cache.decode(token)
     except JWTError:
-        raise HTTPException(status_code=403, detail="Could not validate credentials")
\ No newline at end of file
+        raise HTTPException(status_code=403, detail="Could not validate credentials")
+
+
+async def get_cart_owner(
+    request: Request,
+    token: Optional[str] = Depends(optional_oauth2)
+) -> int | str:
+    """
+    Владелец корзины: user_id по валидному токену, иначе гостевая корзина,
+    привязанная к сессии (cookie SessionMiddleware).
+    """
+    if token:
+        return await get_current_user_id(token)
+
+    guest_id = request.session.get(GUEST_SESSION_KEY)
+    if not guest_id:
+        guest_id = uuid.uuid4().hex
+        request.session[GUEST_SESSION_KEY] = guest_id
+    return f"guest:{guest_id}"
+
+
+def pop_guest_cart_owner(request: Request) -> Optional[str]:
+    """
+    Забирает гостевую корзину из сессии при входе (для слияния с корзиной пользователя).
+    """
+    guest_id = request.session.pop(GUEST_SESSION_KEY, None)
+    return f"guest:{guest_id}" if guest_id else None
+
+
+async def merge_guest_cart(request: Request, db: AsyncSession, user_id: int) -> None:
+    """
+    После входа гостевая корзина из сессии переезжает в корзину пользователя.
+    """
+    guest = pop_guest_cart_owner(request)
+    if guest:
+        await CartService(db).merge_guest_cart(guest, user_id)
@@ -0,0 +1,70 @@
+import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import get_current_user_id
+from app.db.session import get_db
+from app.schemas.analytics import SalesReport, ProductSalesRead, ProductDailySalesRead
+from app.services.sales_rollup_service import SalesRollupService
+
+# Выручка магазина - не публичные данные: все отчеты только для авторизованных
+router = APIRouter(dependencies=[Depends(get_current_user_id)])
+
+# Период по умолчанию и максимальная длина периода в днях
+DEFAULT_PERIOD_DAYS = 30
+MAX_PERIOD_DAYS = 366
+
+
+def _period(date_from: Optional[datetime.date], date_to: Optional[datetime.date]) -> tuple[datetime.date, datetime.date]:
+    date_to = date_to or datetime.datetime.now(datetime.timezone.utc).date()
+    date_from = date_from or date_to - datetime.timedelta(days=DEFAULT_PERIOD_DAYS - 1)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to")
+    if (date_to - date_from).days >= MAX_PERIOD_DAYS:
+        raise HTTPException(status_code=400, detail=f"Period must not exceed {MAX_PERIOD_DAYS} days")
+    return date_from, date_to
+
+
+@router.get("/sales", response_model=SalesReport)
+async def get_sales(
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Выручка и число заказов по дням (UTC) из агрегата daily_sales.
+    По умолчанию - последние 30 дней.
+    """
+    date_from, date_to = _period(date_from, date_to)
+    report = await SalesRollupService(db).get_daily_sales(date_from, date_to)
+    return {"date_from": date_from, "date_to": date_to, **report}
+
+
+@router.get("/top-products", response_model=List[ProductSalesRead])
+async def get_top_products(
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Бестселлеры за период по проданным единицам.
+    """
+    date_from, date_to = _period(date_from, date_to)
+    return await SalesRollupService(db).get_top_products(date_from, date_to, limit)
+
+
+@router.get("/products/{product_id}/sales", response_model=List[ProductDailySalesRead])
+async def get_product_sales(
+    product_id: int,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Продажи товара по дням за период.
+    """
+    date_from, date_to = _period(date_from, date_to)
+    return await SalesRollupService(db).get_product_sales(product_id, date_from, date_to)
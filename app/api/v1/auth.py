@@ -1,38 +1,56 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.session import get_db
-from app.schemas.user import UserCreate, UserRead, Token
-from app.core.security import create_access_token
+from app.schemas.user import UserCreate, UserRead, Token, RefreshRequest, telegram_email
+from app.core.config import settings
+from app.core.rate_limit import RateLimit, client_ip, form_field, json_field
+from app.api.deps import get_current_user_id, merge_guest_cart
 
-import uuid
 from app.schemas.telegram import TelegramAuth
 from app.services.telegram_service import validate_telegram_data
 from app.services.user_service import UserService
+from app.services.token_service import TokenService
 router = APIRouter()
 
+# Лимиты проверяются до БД и bcrypt: по IP и по учетной записи (email из формы/тела)
+login_ip_limit = RateLimit("login_ip", settings.RATE_LIMIT_LOGIN_IP, client_ip)
+login_account_limit = RateLimit("login_account", settings.RATE_LIMIT_LOGIN_ACCOUNT, form_field("username"))
+register_ip_limit = RateLimit("register_ip", settings.RATE_LIMIT_REGISTER_IP, client_ip)
+register_account_limit = RateLimit("register_account", settings.RATE_LIMIT_REGISTER_ACCOUNT, json_field("email"))
+# Обмен refresh-токена дешевый и частый - отдельная корзина, чтобы не расходовать лимит входа по паролю
+refresh_ip_limit = RateLimit("refresh_ip", settings.RATE_LIMIT_REFRESH_IP, client_ip)
 
-@router.post("/register", response_model=UserRead)
+
+@router.post(
+    "/register",
+    response_model=UserRead,
+    dependencies=[Depends(register_ip_limit), Depends(register_account_limit)],
+)
 async def register(
         user_in: UserCreate,
         db: AsyncSession = Depends(get_db)
 ):
     service = UserService(db)
 
-    # 1. Проверяем бизнес-логику (существование)
-    if await service.get_by_email(user_in.email):
+    # Проверка существования и создание - один INSERT ... ON CONFLICT (email) DO NOTHING
+    user = await service.create_user(user_in)
+    if not user:
         raise HTTPException(
             status_code=400,
             detail="The user with this email already exists.",
         )
-
-    # 2. Делегируем создание сервису
-    return await service.create_user(user_in)
+    return user
 
 
-@router.post("/login", response_model=Token)
+@router.post(
+    "/login",
+    response_model=Token,
+    dependencies=[Depends(login_ip_limit), Depends(login_account_limit)],
+)
 async def login(
+        request: Request,
         form_data: OAuth2PasswordRequestForm = Depends(),
         db: AsyncSession = Depends(get_db)
 ):
@@ -47,14 +65,14 @@ async def login(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    return {
-        "access_token": create_access_token(user.id),
-        "token_type": "bearer",
-    }
+    await merge_guest_cart(request, db, user.id)
 
+    return await TokenService(db).issue_tokens(user.id)
 
-@router.post("/login/telegram", response_model=Token)
+
+@router.post("/login/telegram", response_model=Token, dependencies=[Depends(login_ip_limit)])
 async def telegram_login(
+        request: Request,
         tg_data: TelegramAuth,
         db: AsyncSession = Depends(get_db)
 ):
@@ -62,25 +80,60 @@ async def telegram_login(
     if not validate_telegram_data(tg_data):
         raise HTTPException(status_code=400, detail="Invalid Telegram data or signature")
 
-    # 2. Логика пользователя
-    # Telegram НЕ отдает Email. У нас есть два пути:
-    # А) Создать фейковый email (простой путь)
-    # Б) Добавить поле telegram_id в таблицу User (правильный путь)
+    # 2. Find-or-create по telegram id одним upsert (без пароля).
+    # Email у таких пользователей технический: Telegram его не отдает
+    service = UserService(db)
+    try:
+        user = await service.get_or_create_external_user(
+            "telegram", str(tg_data.id), telegram_email(tg_data.id)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    await merge_guest_cart(request, db, user.id)
 
-    # Идем по пути А (чтобы не менять БД прямо сейчас):
-    fake_email = f"{tg_data.id}@telegram.user"
+    # 3. Выдаем токены
+    return await TokenService(db).issue_tokens(user.id)
 
-    service = UserService(db)
-    user = await service.get_by_email(fake_email)
 
-    if not user:
-        # Регистрируем нового
-        # Пароль рандомный, так как вход только через ТГ
-        user_in = UserCreate(email=fake_email, password=str(uuid.uuid4()))
-        user = await service.create_user(user_in)
-
-    # 3. Выдаем токен
-    return {
-        "access_token": create_access_token(user.id),
-        "token_type": "bearer",
-    }
\ No newline at end of file
+
+@router.post("/refresh", response_model=Token, dependencies=[Depends(refresh_ip_limit)])
+async def refresh_tokens(
+        body: RefreshRequest,
+        db: AsyncSession = Depends(get_db)
+):
+    """
+    Обменивает refresh-токен на новую пару (без пароля и bcrypt).
+    Refresh-токен одноразовый: повторное использование отзывает всю цепочку.
+    """
+    try:
+        return await TokenService(db).refresh(body.refresh_token)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e),
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+@router.post("/logout", status_code=204)
+async def logout(
+        body: RefreshRequest,
+        db: AsyncSession = Depends(get_db)
+):
+    """
+    Отзывает refresh-токен (и всю его цепочку ротации).
+    """
+    await TokenService(db).revoke(body.refresh_token)
+
+
+@router.post("/logout-all", status_code=204)
+async def logout_all(
+        user_id: int = Depends(get_current_user_id),
+        db: AsyncSession = Depends(get_db)
+):
+    """
+    Выход на всех устройствах: отзывает все refresh-токены пользователя
+    и его действующие access-токены (во всех воркерах).
+    """
+    await TokenService(db).revoke_user(user_id)
@@ -1,53 +1,85 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.session import get_db
 from app.services.cart_service import CartService
-from app.schemas.cart import CartRead, CartItemBase, CartItemUpdate
-from app.api.deps import get_current_user_id
+from app.schemas.cart import CartRead, CartItemBase, CartItemUpdate, CartBatchRequest, CartSummary
+from app.api.deps import get_cart_owner
 
 router = APIRouter()
 
 
 @router.get("/", response_model=CartRead)
 async def get_my_cart(
-        user_id: int = Depends(get_current_user_id),
+        owner: int | str = Depends(get_cart_owner),
         db: AsyncSession = Depends(get_db)
 ):
     service = CartService(db)
-    return await service.get_or_create_cart(user_id)
+    return await service.get_or_create_cart(owner)
+
+
+@router.get("/summary", response_model=CartSummary)
+async def get_my_cart_summary(
+        owner: int | str = Depends(get_cart_owner),
+        db: AsyncSession = Depends(get_db)
+):
+    """
+    Итоги корзины для бейджа в шапке: количество товаров, число позиций и сумма.
+    """
+    service = CartService(db)
+    return await service.get_summary(owner)
 
 
 @router.post("/add", response_model=CartRead)
 async def add_item_to_cart(
         item_in: CartItemBase,
-        user_id: int = Depends(get_current_user_id),
+        owner: int | str = Depends(get_cart_owner),
         db: AsyncSession = Depends(get_db)
 ):
     service = CartService(db)
-    return await service.add_item(user_id, item_in.product_id, item_in.quantity)
+    try:
+        return await service.add_item(owner, item_in.product_id, item_in.quantity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.patch("/items", response_model=CartRead)
 async def update_cart_item_quantity(
         item_in: CartItemUpdate,
-        user_id: int = Depends(get_current_user_id),
+        owner: int | str = Depends(get_cart_owner),
         db: AsyncSession = Depends(get_db)
 ):
     """
     Изменяет количество конкретного товара в корзине.
     """
     service = CartService(db)
-    return await service.update_item_quantity(user_id, item_in.product_id, item_in.quantity)
+    return await service.update_item_quantity(owner, item_in.product_id, item_in.quantity)
 
 
 @router.delete("/items/{product_id}", response_model=CartRead)
 async def remove_item_from_cart(
         product_id: int,
-        user_id: int = Depends(get_current_user_id),
+        owner: int | str = Depends(get_cart_owner),
         db: AsyncSession = Depends(get_db)
 ):
     """
     Полностью удаляет товар из корзины.
     """
     service = CartService(db)
-    return await service.remove_item(user_id, product_id)
+    return await service.remove_item(owner, product_id)
+
+
+@router.post("/batch", response_model=CartRead)
+async def apply_cart_operations(
+        batch_in: CartBatchRequest,
+        owner: int | str = Depends(get_cart_owner),
+        db: AsyncSession = Depends(get_db)
+):
+    """
+    Применяет список операций add/set/remove одной транзакцией
+    (синхронизация офлайн-правок) и возвращает итоговую корзину.
+    """
+    service = CartService(db)
+    try:
+        return await service.apply_operations(owner, batch_in.operations)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
@@ -18,5 +18,8 @@ async def create_category(
 
 @router.get("/", response_model=List[CategoryRead])
 async def get_categories(db: AsyncSession = Depends(get_db)):
+    """
+    Отдает дерево категорий из кэша уже сериализованным JSON.
+    """
     service = CategoryService(db)
-    return await service.get_all_categories()
\ No newline at end of file
+    return Response(content=await service.get_category_tree_json(), media_type="application/json")
\ No newline at end of file
@@ -1,19 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional, Union
+
+from fastapi import APIRouter, Depends, HTTPException, Header, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.session import get_db
 from app.services.order_service import OrderService
-from app.schemas.order import OrderRead
+from app.schemas.order import OrderRead, OrderPage, OrderSummaryPage
 from app.api.deps import get_current_user_id
 
 router = APIRouter()
 
 @router.post("/", response_model=OrderRead)
 async def checkout(
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Оформляет заказ из корзины.
+    С заголовком Idempotency-Key повторы запроса (ретраи клиента) возвращают тот же заказ.
+    """
+    service = OrderService(db)
+    try:
+        return await service.create_order(user_id, idempotency_key)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/", response_model=Union[OrderSummaryPage, OrderPage])
+async def list_my_orders(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    summary: bool = False,
     user_id: int = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_db)
 ):
+    """
+    История заказов, новые сверху. Следующая страница - через next_cursor.
+    summary=true возвращает краткие строки (без позиций) с количеством товаров.
+    """
     service = OrderService(db)
     try:
-        return await service.create_order(user_id)
+        page = await service.get_user_orders(user_id, limit, cursor, summary)
     except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+    return OrderSummaryPage.model_validate(page) if summary else OrderPage.model_validate(page)
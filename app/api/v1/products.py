@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Header, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Optional, Union
 
-from app.db.session import get_db
+from app.db.session import get_db, AsyncSessionLocal
 from app.schemas.product import ProductCreate, ProductRead, ProductFilter, ProductUpdate, GenerateDescriptionRequest, \
-    GenerateDescriptionResponse
+    GenerateDescriptionResponse, ProductPage, ProductImportReport, CatalogFormat, ProductBatchRequest, \
+    ProductBatchResponse
 from app.services.llm_service import get_llm_service
+from app.services.product_export_service import ProductExportService
+from app.services.product_import_service import ProductImportService, iter_records, detect_import_format
 from app.services.product_service import ProductService
 from app.services.s3_service import S3Service
 
@@ -47,26 +53,105 @@ async def create_product(
     # Теперь product_in уже содержит description, который прислал фронтенд
     return await service.create_product(product_in, image_url)
 
+# Массовый импорт каталога (CSV / NDJSON)
+@router.post("/import", response_model=ProductImportReport)
+async def import_products(
+    file: UploadFile = File(...),
+    format: Optional[CatalogFormat] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Потоково импортирует товары из CSV или NDJSON с upsert по sku.
+    Формат берется из параметра format или из расширения файла.
+    Колонки: sku, name, price, category_id, description, specs (JSON), image_url.
+    """
+    fmt = format or detect_import_format(file.filename)
+    if fmt is None:
+        raise HTTPException(status_code=400, detail="Unknown file format, pass format=csv|ndjson")
+
+    # Читаем загруженный файл построчно, не поднимая его целиком в память
+    service = ProductImportService(db)
+    return await service.import_records(iter_records(file.file, fmt))
+
+# Выгрузка каталога (фиды маркетплейсов, поисковый индексатор)
+@router.post("/export")
+async def export_products(
+    filters: Optional[ProductFilter] = None,
+    format: CatalogFormat = CatalogFormat.NDJSON,
+):
+    """
+    Потоково отдает все товары (опционально по фильтру) в NDJSON или CSV.
+    Сортировка и пагинация из фильтра игнорируются: товары идут по возрастанию id.
+    """
+    media_type = "text/csv" if format == CatalogFormat.CSV else "application/x-ndjson"
+    return StreamingResponse(
+        _export_stream(filters, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="products.{format.value}"'},
+    )
+
+
+async def _export_stream(filters: Optional[ProductFilter], fmt: CatalogFormat):
+    # Своя сессия: сессия из get_db закрывается раньше, чем начнется отдача тела ответа
+    async with AsyncSessionLocal() as session:
+        async for chunk in ProductExportService(session).export(filters, fmt):
+            yield chunk
+
 # 3. Поиск и фильтрация (ТЗ: POST метод для фильтрации)
-@router.post("/search", response_model=List[ProductRead])
+@router.post("/search", response_model=Union[ProductPage, List[ProductRead]])
 async def search_products(
     filters: ProductFilter,
     db: AsyncSession = Depends(get_db)
 ):
+    """
+    По умолчанию - список товаров (page/limit), как раньше.
+    С paginated=true, cursor или facets=true - страница {items, next_cursor, facets}:
+    для следующей страницы передайте next_cursor в поле cursor с теми же фильтрами.
+    """
+    service = ProductService(db)
+    try:
+        page = await service.get_filtered_products(filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if filters.paginated or filters.cursor or filters.facets:
+        return page
+    return page["items"]
+
+# Несколько карточек одним запросом (избранное, "недавно смотрели", история заказов)
+@router.post("/batch", response_model=ProductBatchResponse)
+async def get_products_batch(
+    req: ProductBatchRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Возвращает товары в порядке ids и список ненайденных id.
+    Карточки из кэша не трогают БД; ответ склеивается из уже сериализованного JSON.
+    """
     service = ProductService(db)
-    return await service.get_filtered_products(filters)
+    items, missing = await service.get_cached_products(req.ids)
+    content = b'{"items":[' + b",".join(item.payload for item in items) + b'],"missing":' + \
+        json.dumps(missing).encode() + b"}"
+    return Response(content=content, media_type="application/json")
 
 # 4. Детальная страница
 @router.get("/{product_id}", response_model=ProductRead)
 async def get_product(
     product_id: int,
+    if_none_match: Optional[str] = Header(None),
     db: AsyncSession = Depends(get_db)
 ):
+    """
+    Карточка товара из кэша. Отдает ETag; при совпадении If-None-Match - 304 без тела.
+    """
     service = ProductService(db)
-    product = await service.get_product_by_id(product_id)
-    if not product:
+    cached = await service.get_cached_product(product_id)
+    if not cached:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+
+    headers = {"ETag": cached.etag}
+    if if_none_match and _etag_matches(if_none_match, cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.payload, media_type="application/json", headers=headers)
 
 @router.patch("/{product_id}", response_model=ProductRead)
 async def update_product(
@@ -89,4 +174,13 @@ async def delete_product(
     deleted = await service.delete_product(product_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Product not found")
-    return {"status": "deleted"}
\ No newline at end of file
+    return {"status": "deleted"}
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match сравнивается "слабо": W/"x" совпадает с "x"
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
@@ -0,0 +1,58 @@
+"""
+Служебные команды.
+
+    python -m app.cli import-products catalog.csv
+    python -m app.cli import-products catalog.ndjson --format ndjson
+    python -m app.cli rebuild-sales-rollups
+"""
+import argparse
+import asyncio
+
+from app.db.session import AsyncSessionLocal
+from app.schemas.product import CatalogFormat
+from app.services.product_import_service import ProductImportService, iter_records, detect_import_format
+from app.services.sales_rollup_service import SalesRollupService
+
+
+async def import_products(path: str, fmt: CatalogFormat) -> None:
+    async with AsyncSessionLocal() as session:
+        with open(path, "rb") as stream:
+            report = await ProductImportService(session).import_records(iter_records(stream, fmt))
+
+    for batch in report["batches"]:
+        print(f"batch {batch['batch']}: rows={batch['rows']} upserted={batch['upserted']} errors={batch['failed']}")
+        for error in batch["errors"]:
+            print(f"  row {error['row']}: {error['error']}")
+    if report["errors_truncated"]:
+        print(f"  ... only the first {ProductImportService.MAX_REPORTED_ERRORS} row errors are listed")
+    print(f"Done: rows={report['total_rows']} upserted={report['upserted']} failed={report['failed']}")
+
+
+async def rebuild_sales_rollups() -> None:
+    async with AsyncSessionLocal() as session:
+        await SalesRollupService(session).rebuild()
+    print("Done: sales rollups rebuilt")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_cmd = commands.add_parser("import-products", help="Массовый импорт товаров из CSV/NDJSON (upsert по sku)")
+    import_cmd.add_argument("path")
+    import_cmd.add_argument("--format", choices=[f.value for f in CatalogFormat])
+
+    commands.add_parser("rebuild-sales-rollups", help="Полный пересчет агрегатов продаж по истории заказов")
+
+    args = parser.parse_args()
+    if args.command == "import-products":
+        fmt = CatalogFormat(args.format) if args.format else detect_import_format(args.path)
+        if fmt is None:
+            parser.error("Unknown file format, pass --format csv|ndjson")
+        asyncio.run(import_products(args.path, fmt))
+    elif args.command == "rebuild-sales-rollups":
+        asyncio.run(rebuild_sales_rollups())
+
+
+if __name__ == "__main__":
+    main()
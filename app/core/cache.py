@@ -0,0 +1,242 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from app.core.config import settings
+
+
+class CacheBackend:
+    """
+    Базовый интерфейс общего (между воркерами) хранилища ключ-значение.
+    Помимо строковых значений умеет целочисленные хеши (поле -> число), например корзины.
+    """
+
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def incr(self, key: str) -> int:
+        raise NotImplementedError
+
+    async def hgetall(self, key: str) -> dict[str, int]:
+        raise NotImplementedError
+
+    async def hupdate(
+            self,
+            key: str,
+            set_values: Optional[dict[str, int]] = None,
+            incr_values: Optional[dict[str, int]] = None,
+            delete_fields: Optional[list[str]] = None,
+            ttl: Optional[int] = None,
+    ) -> None:
+        """
+        Атомарно: удалить поля, выставить значения, прибавить к значениям, продлить TTL ключа.
+        """
+        raise NotImplementedError
+
+    async def htake(self, key: str) -> dict[str, int]:
+        """
+        Атомарно прочитать хеш целиком и удалить ключ.
+        """
+        raise NotImplementedError
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """
+    Хранилище внутри процесса. Подходит для одного воркера и для тестов.
+    """
+
+    def __init__(self):
+        # Значение - bytes для строк или dict для хешей
+        self._data: dict[str, tuple[Any, Optional[float]]] = {}
+
+    def _alive(self, key: str) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._alive(key)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._data[key] = (value, expires_at)
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    async def incr(self, key: str) -> int:
+        value = int(self._alive(key) or 0) + 1
+        self._data[key] = (str(value).encode(), None)
+        return value
+
+    async def hgetall(self, key: str) -> dict[str, int]:
+        return dict(self._alive(key) or {})
+
+    async def hupdate(self, key, set_values=None, incr_values=None, delete_fields=None, ttl=None) -> None:
+        # Внутри одного event loop между await нет переключений, поэтому операция атомарна
+        values = self._alive(key) or {}
+        expires_at = self._data[key][1] if key in self._data else None
+        for field in delete_fields or []:
+            values.pop(field, None)
+        values.update(set_values or {})
+        for field, amount in (incr_values or {}).items():
+            values[field] = values.get(field, 0) + amount
+        if ttl:
+            expires_at = time.monotonic() + ttl
+        if values:
+            self._data[key] = (values, expires_at)
+        else:
+            self._data.pop(key, None)
+
+    async def htake(self, key: str) -> dict[str, int]:
+        values = self._alive(key) or {}
+        self._data.pop(key, None)
+        return dict(values)
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Общее хранилище для нескольких воркеров: любой сервер с протоколом Redis.
+    """
+
+    def __init__(self, url: str):
+        from redis.asyncio import Redis
+
+        self.client = Redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+        await self.client.set(key, value, ex=ttl)
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(key)
+
+    async def incr(self, key: str) -> int:
+        return await self.client.incr(key)
+
+    async def hgetall(self, key: str) -> dict[str, int]:
+        raw = await self.client.hgetall(key)
+        return {field.decode(): int(value) for field, value in raw.items()}
+
+    async def hupdate(self, key, set_values=None, incr_values=None, delete_fields=None, ttl=None) -> None:
+        # MULTI/EXEC: все команды применяются разом
+        async with self.client.pipeline(transaction=True) as pipe:
+            if delete_fields:
+                pipe.hdel(key, *delete_fields)
+            if set_values:
+                pipe.hset(key, mapping=set_values)
+            for field, amount in (incr_values or {}).items():
+                pipe.hincrby(key, field, amount)
+            if ttl:
+                pipe.expire(key, ttl)
+            await pipe.execute()
+
+    async def htake(self, key: str) -> dict[str, int]:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hgetall(key)
+            pipe.delete(key)
+            raw, _ = await pipe.execute()
+        return {field.decode(): int(value) for field, value in raw.items()}
+
+
+class CacheStats:
+    """
+    Счетчики попаданий и время пересборки для одного кэша.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.rebuild_seconds_total = 0.0
+        self.rebuild_seconds_last = 0.0
+
+    def record_rebuild(self, seconds: float) -> None:
+        self.rebuilds += 1
+        self.rebuild_seconds_total += seconds
+        self.rebuild_seconds_last = seconds
+
+    def as_dict(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "rebuilds": self.rebuilds,
+            "rebuild_ms_last": self.rebuild_seconds_last * 1000,
+            "rebuild_ms_avg": self.rebuild_seconds_total * 1000 / self.rebuilds if self.rebuilds else 0.0,
+        }
+
+
+class LRUCache:
+    """
+    Ограниченный по размеру кэш в памяти процесса с временем жизни записей.
+    При переполнении вытесняется запись, к которой дольше всего не обращались.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._data: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        item = self._data.get(key)
+        if item is None or item[1] <= time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.stats.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.stats.hits += 1
+        return item[0]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def items(self) -> list[tuple[Hashable, Any]]:
+        """
+        Снимок живых записей (без учета в статистике и без изменения порядка LRU).
+        """
+        now = time.monotonic()
+        return [(key, value) for key, (value, expires_at) in self._data.items() if expires_at > now]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats_dict(self) -> dict:
+        return {**self.stats.as_dict(), "size": len(self._data), "maxsize": self.maxsize}
+
+
+def get_cache_backend() -> CacheBackend:
+    """
+    Фабрика: если задан REDIS_URL - общее хранилище, иначе память процесса.
+    """
+    if settings.REDIS_URL:
+        return RedisCacheBackend(settings.REDIS_URL)
+    return InMemoryCacheBackend()
+
+
+cache_backend = get_cache_backend()
@@ -0,0 +1,59 @@
+import time
+
+
+class CircuitOpenError(Exception):
+    """
+    Внешний сервис признан недоступным: вызов отклонен без обращения к нему.
+    """
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для внешнего сервиса.
+    closed: вызовы идут как обычно; failure_threshold сбоев подряд -> open.
+    open: вызовы сразу отклоняются (CircuitOpenError) в течение reset_timeout секунд.
+    half_open: пропускается один пробный вызов; успех -> closed, сбой -> снова open.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_in_flight = False
+
+    def before_call(self) -> None:
+        if self.state == "closed":
+            return
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+        self.rejected += 1
+        raise CircuitOpenError(f"{self.name} is unavailable")
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """
+        Вызов завершился без признаков недоступности сервиса (например, ошибка клиента):
+        статистику не трогаем, но освобождаем пробный слот.
+        """
+        self._probe_in_flight = False
+
+    def stats_dict(self) -> dict:
+        return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
@@ -27,8 +27,72 @@ class Settings(BaseSettings):
     YANDEX_CLIENT_ID: Optional[str] = os.getenv("VK_CLIENT_ID")
     YANDEX_CLIENT_SECRET: Optional[str] = os.getenv("VK_CLIENT_ID")
 
+    # Адреса OAuth-провайдеров (для тестов - локальный сервер-заглушка) и таймауты (сек)
+    VK_OAUTH_URL: str = "https://oauth.vk.com"
+    VK_API_URL: str = "https://api.vk.com/method"
+    VK_CONNECT_TIMEOUT: float = 3.0
+    VK_READ_TIMEOUT: float = 10.0
+    YANDEX_OAUTH_URL: str = "https://oauth.yandex.ru"
+    YANDEX_LOGIN_URL: str = "https://login.yandex.ru"
+    YANDEX_CONNECT_TIMEOUT: float = 3.0
+    YANDEX_READ_TIMEOUT: float = 10.0
+    # Общий пул соединений к провайдерам и предохранитель: после N сбоев подряд
+    # запросы к провайдеру сразу отклоняются на OAUTH_BREAKER_RESET секунд
+    OAUTH_MAX_CONNECTIONS: int = 20
+    OAUTH_BREAKER_FAILURES: int = 5
+    OAUTH_BREAKER_RESET: float = 30.0
+
     TG_BOT_TOKEN: Optional[str] = None
 
+    # Общий кэш для нескольких воркеров (redis://...). Если не задан, кэш живет в памяти процесса
+    REDIS_URL: Optional[str] = os.getenv("REDIS_URL")
+
+    # Кэш карточек товаров в памяти процесса (между воркерами расходится не дольше TTL)
+    PRODUCT_CACHE_SIZE: int = 10_000
+    PRODUCT_CACHE_TTL: int = 60
+
+    # Хранилище корзин: "sql" (PostgreSQL) или "kv" (хеш на корзину в REDIS_URL / памяти процесса).
+    # Гостевые корзины всегда хранятся в KV
+    CART_STORAGE: str = "sql"
+    CART_TTL: int = 30 * 24 * 60 * 60
+
+    # Фоновая обработка outbox: размер пачки, опрос при пустой очереди (сек),
+    # повторы с экспоненциальной паузой OUTBOX_RETRY_BASE * 2^n, но не больше OUTBOX_RETRY_MAX
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_POLL_INTERVAL: float = 1.0
+    OUTBOX_MAX_ATTEMPTS: int = 10
+    OUTBOX_RETRY_BASE: float = 1.0
+    OUTBOX_RETRY_MAX: float = 300.0
+    # Сколько событие закреплено за воркером, взявшим его (потом его возьмет другой)
+    OUTBOX_LEASE: int = 60
+
+    # bcrypt: стоимость (при смене хеши пересчитываются при входе пользователя)
+    # и пул, в котором он считается: "thread" или "process"; размер пула - предел параллельных хешей
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_EXECUTOR: str = "thread"
+    PASSWORD_HASH_WORKERS: int = 2
+
+    # Кэш проверенных JWT (записей) - повторные запросы с тем же токеном без проверки подписи
+    ACCESS_TOKEN_CACHE_SIZE: int = 50_000
+
+    # Ограничение входа/регистрации (token bucket): "N/S" - N запросов за S секунд.
+    # Корзины общие для воркеров при заданном REDIS_URL, иначе в памяти процесса
+    RATE_LIMIT_LOGIN_IP: str = "20/60"
+    RATE_LIMIT_LOGIN_ACCOUNT: str = "5/60"
+    RATE_LIMIT_REGISTER_IP: str = "5/600"
+    RATE_LIMIT_REGISTER_ACCOUNT: str = "5/60"
+    RATE_LIMIT_REFRESH_IP: str = "60/60"
+    RATE_LIMIT_MAX_KEYS: int = 100_000
+    # Адреса/подсети обратных прокси через запятую (например, "172.16.0.0/12" для сети Docker
+    # с cloudflared): от них адрес клиента берется из X-Forwarded-For
+    TRUSTED_PROXIES: str = ""
+
+    # Как часто удалять просроченные и отозванные refresh-токены (сек)
+    REFRESH_TOKEN_PURGE_INTERVAL: int = 60 * 60
+    # Повтор только что обмененного refresh-токена в течение стольких секунд (две вкладки обновили
+    # сессию одновременно) отклоняется без отзыва цепочки; позже - считается кражей
+    REFRESH_TOKEN_REUSE_GRACE: int = 10
+
     SESSION_SECRET: str = secrets.token_urlsafe(15)
 
     @property
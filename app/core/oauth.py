@@ -1,28 +1,140 @@
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
 from authlib.integrations.starlette_client import OAuth
+
+from app.core.circuit_breaker import CircuitBreaker
 from app.core.config import settings
+from app.core.metrics import register_metrics
 
 oauth = OAuth()
 
-# 1. Настройка VK
-if settings.VK_CLIENT_ID:
-    oauth.register(
-        name='vk',
-        client_id=settings.VK_CLIENT_ID,
-        client_secret=settings.VK_CLIENT_SECRET,
-        authorize_url='https://oauth.vk.com/authorize',
-        access_token_url='https://oauth.vk.com/access_token',
-        api_base_url='https://api.vk.com/method/',
-        # client_kwargs={'scope': 'email'}, # Запрашиваем email
-    )
-
-# 2. Настройка Yandex
-if settings.YANDEX_CLIENT_ID:
-    oauth.register(
-        name='yandex',
-        client_id=settings.YANDEX_CLIENT_ID,
-        client_secret=settings.YANDEX_CLIENT_SECRET,
-        authorize_url='https://oauth.yandex.ru/authorize',
-        access_token_url='https://oauth.yandex.ru/token',
-        api_base_url='https://login.yandex.ru/',
-        client_kwargs={'scope': 'login:email'},
-    )
\ No newline at end of file
+T = TypeVar("T")
+
+
+class SharedTransport(httpx.AsyncBaseTransport):
+    """
+    Общий пул keep-alive соединений для всех OAuth-клиентов.
+    Authlib создает httpx-клиент на каждый вызов и закрывает его после,
+    поэтому закрытие клиента пул не закрывает - это делает close_oauth_clients.
+    """
+
+    def __init__(self, transport: httpx.AsyncHTTPTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        await self._transport.aclose()
+
+
+def _provider_specs() -> dict[str, dict]:
+    # Адреса провайдеров настраиваются: для тестов их можно направить на локальный OAuth-сервер
+    return {
+        "vk": {
+            "client_id": settings.VK_CLIENT_ID,
+            "client_secret": settings.VK_CLIENT_SECRET,
+            "authorize_url": f"{settings.VK_OAUTH_URL}/authorize",
+            "access_token_url": f"{settings.VK_OAUTH_URL}/access_token",
+            "api_base_url": f"{settings.VK_API_URL}/",
+            "timeout": httpx.Timeout(settings.VK_READ_TIMEOUT, connect=settings.VK_CONNECT_TIMEOUT),
+        },
+        "yandex": {
+            "client_id": settings.YANDEX_CLIENT_ID,
+            "client_secret": settings.YANDEX_CLIENT_SECRET,
+            "authorize_url": f"{settings.YANDEX_OAUTH_URL}/authorize",
+            "access_token_url": f"{settings.YANDEX_OAUTH_URL}/token",
+            "api_base_url": f"{settings.YANDEX_LOGIN_URL}/",
+            "timeout": httpx.Timeout(settings.YANDEX_READ_TIMEOUT, connect=settings.YANDEX_CONNECT_TIMEOUT),
+            "scope": "login:email",
+        },
+    }
+
+
+_transport: Optional[SharedTransport] = None
+_clients: dict = {}
+breakers: dict[str, CircuitBreaker] = {}
+
+
+def init_oauth_clients() -> None:
+    """
+    Создает клиентов провайдеров один раз при старте приложения (lifespan).
+    Регистрируются только провайдеры с заданным client_id.
+    """
+    global _transport
+    if _transport is None:
+        _transport = SharedTransport(httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=settings.OAUTH_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OAUTH_MAX_CONNECTIONS,
+            ),
+        ))
+
+    for name, spec in _provider_specs().items():
+        if not spec["client_id"] or name in _clients:
+            continue
+        client_kwargs = {"transport": _transport, "timeout": spec["timeout"]}
+        if spec.get("scope"):
+            client_kwargs["scope"] = spec["scope"]
+        oauth.register(
+            name=name,
+            client_id=spec["client_id"],
+            client_secret=spec["client_secret"],
+            authorize_url=spec["authorize_url"],
+            access_token_url=spec["access_token_url"],
+            api_base_url=spec["api_base_url"],
+            client_kwargs=client_kwargs,
+        )
+        _clients[name] = oauth.create_client(name)
+        breakers[name] = CircuitBreaker(
+            f"OAuth provider {name}", settings.OAUTH_BREAKER_FAILURES, settings.OAUTH_BREAKER_RESET
+        )
+
+
+async def close_oauth_clients() -> None:
+    global _transport
+    if _transport is not None:
+        await _transport.close()
+        _transport = None
+
+
+def get_oauth_client(provider: str):
+    return _clients.get(provider)
+
+
+def _is_provider_failure(e: Exception) -> bool:
+    # Провайдер недоступен: сеть/таймаут или 5xx. Ошибки OAuth (неверный code и т.п.) не в счет
+    if isinstance(e, httpx.TransportError):
+        return True
+    return isinstance(e, httpx.HTTPStatusError) and e.response.status_code >= 500
+
+
+async def call_provider(provider: str, call: Callable[[], Awaitable[T]]) -> T:
+    """
+    Выполняет запрос к провайдеру через его предохранитель.
+    При открытом предохранителе сразу бросает CircuitOpenError.
+    """
+    breaker = breakers[provider]
+    breaker.before_call()
+    try:
+        result = await call()
+    except Exception as e:
+        if _is_provider_failure(e):
+            breaker.record_failure()
+        else:
+            breaker.release()
+        raise
+    except BaseException:
+        # Отмена (CancelledError) - не сбой провайдера, но пробный слот half_open надо освободить,
+        # иначе предохранитель будет отклонять все вызовы до перезапуска процесса
+        breaker.release()
+        raise
+    breaker.record_success()
+    return result
+
+
+register_metrics("oauth_providers", lambda: {name: breaker.stats_dict() for name, breaker in breakers.items()})
@@ -0,0 +1,26 @@
+import base64
+import json
+from typing import Any
+
+
+def encode_cursor(payload: dict[str, Any]) -> str:
+    """
+    Упаковывает позицию keyset-пагинации в непрозрачную для клиента строку.
+    """
+    raw = json.dumps(payload, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict[str, Any]:
+    """
+    Обратная операция к encode_cursor. На битый курсор бросает ValueError.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+    if not isinstance(payload, dict):
+        raise ValueError("Invalid cursor")
+    return payload
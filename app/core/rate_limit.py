@@ -0,0 +1,208 @@
+import ipaddress
+import math
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from fastapi import HTTPException, Request
+
+from app.core.config import settings
+from app.core.metrics import register_metrics
+
+
+class RateLimitStore:
+    """
+    Хранилище token bucket'ов. take списывает cost токенов из корзины key
+    (вместимость capacity, пополнение rate токенов в секунду) и возвращает 0,
+    если токенов хватило, иначе - через сколько секунд их станет достаточно.
+    """
+
+    async def take(self, key: str, capacity: int, rate: float, cost: int = 1) -> float:
+        raise NotImplementedError
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    """
+    Корзины в памяти процесса (лимит действует на каждый воркер отдельно).
+    Число корзин ограничено: при переполнении вытесняются давно не использованные.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        # key -> (токены, время последнего пересчета)
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def take(self, key: str, capacity: int, rate: float, cost: int = 1) -> float:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * rate)
+
+        retry_after = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            retry_after = (cost - tokens) / rate
+
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+class RedisRateLimitStore(RateLimitStore):
+    """
+    Общие для всех воркеров корзины на сервере с протоколом Redis.
+    Пересчет и списание - один Lua-скрипт (атомарно), время берется с сервера.
+    """
+    SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local cost = tonumber(ARGV[3])
+        local t = redis.call('TIME')
+        local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+        local tokens = tonumber(bucket[1]) or capacity
+        local ts = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+        local retry_after = 0
+        if tokens >= cost then
+            tokens = tokens - cost
+        else
+            retry_after = (cost - tokens) / rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+        return tostring(retry_after)
+    """
+
+    def __init__(self, url: str):
+        from redis.asyncio import Redis
+
+        self.client = Redis.from_url(url)
+        self._script = self.client.register_script(self.SCRIPT)
+
+    async def take(self, key: str, capacity: int, rate: float, cost: int = 1) -> float:
+        return float(await self._script(keys=[key], args=[capacity, rate, cost]))
+
+
+def get_rate_limit_store() -> RateLimitStore:
+    """
+    Фабрика: если задан REDIS_URL - общие для воркеров корзины, иначе память процесса.
+    """
+    if settings.REDIS_URL:
+        return RedisRateLimitStore(settings.REDIS_URL)
+    return InMemoryRateLimitStore(settings.RATE_LIMIT_MAX_KEYS)
+
+
+rate_limit_store = get_rate_limit_store()
+
+# Ключ корзины из запроса; None - лимит к запросу не применяется
+KeyFunc = Callable[[Request], Awaitable[Optional[str]]]
+
+
+def _parse_networks(value: str) -> list:
+    return [ipaddress.ip_network(item.strip(), strict=False) for item in value.split(",") if item.strip()]
+
+
+trusted_proxies = _parse_networks(settings.TRUSTED_PROXIES)
+
+
+def _is_trusted(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in trusted_proxies)
+
+
+async def client_ip(request: Request) -> Optional[str]:
+    """
+    Адрес клиента. Если запрос пришел от доверенного прокси (TRUSTED_PROXIES), адрес берется
+    из X-Forwarded-For: справа налево до первого адреса, не принадлежащего доверенным прокси.
+    Самому заголовку без доверенного прокси не верим - его может подставить клиент.
+    """
+    host = request.client.host if request.client else None
+    if host is None or not _is_trusted(host):
+        return host
+
+    forwarded = [
+        item.strip()
+        for header in request.headers.getlist("x-forwarded-for")
+        for item in header.split(",")
+        if item.strip()
+    ]
+    for address in reversed(forwarded):
+        if not _is_trusted(address):
+            return address
+    return forwarded[0] if forwarded else host
+
+
+def form_field(name: str) -> KeyFunc:
+    async def key(request: Request) -> Optional[str]:
+        # Форма кэшируется в Request, эндпоинт потом разберет ее без повторного чтения тела
+        value = (await request.form()).get(name)
+        return value.strip().lower() if isinstance(value, str) and value.strip() else None
+    return key
+
+
+def json_field(name: str) -> KeyFunc:
+    async def key(request: Request) -> Optional[str]:
+        try:
+            body = await request.json()
+        except ValueError:
+            return None
+        value = body.get(name) if isinstance(body, dict) else None
+        return value.strip().lower() if isinstance(value, str) and value.strip() else None
+    return key
+
+
+def parse_rate(rate: str) -> tuple[int, float]:
+    """
+    "20/60" -> 20 запросов за 60 секунд: вместимость 20, пополнение 20/60 токена в секунду.
+    """
+    count, seconds = rate.split("/")
+    return int(count), int(count) / float(seconds)
+
+
+class RateLimit:
+    """
+    Зависимость FastAPI с token bucket'ом. Подключается к маршруту декларативно:
+
+        @router.post("/login", dependencies=[Depends(RateLimit("login_ip", "20/60", client_ip))])
+
+    Зависимости выполняются до тела эндпоинта, поэтому отклоненный запрос (429 + Retry-After)
+    не доходит ни до БД, ни до bcrypt.
+    """
+    # Счетчики по всем лимитам: scope -> {"allowed": n, "rejected": n}
+    counters: dict[str, dict[str, int]] = {}
+
+    def __init__(self, scope: str, rate: str, key: KeyFunc, store: Optional[RateLimitStore] = None):
+        self.scope = scope
+        self.capacity, self.refill_rate = parse_rate(rate)
+        self.key = key
+        self.store = store or rate_limit_store
+        self.counters.setdefault(scope, {"allowed": 0, "rejected": 0})
+
+    async def __call__(self, request: Request) -> None:
+        key = await self.key(request)
+        if key is None:
+            return
+
+        try:
+            retry_after = await self.store.take(f"ratelimit:{self.scope}:{key}", self.capacity, self.refill_rate)
+        except Exception as e:
+            # Недоступное хранилище лимитов не должно закрывать вход - пропускаем
+            print(f"Rate limit store error: {e}")
+            return
+        if retry_after > 0:
+            self.counters[self.scope]["rejected"] += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+        self.counters[self.scope]["allowed"] += 1
+
+
+register_metrics("rate_limit", lambda: {scope: dict(counts) for scope, counts in RateLimit.counters.items()})
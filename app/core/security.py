@@ -1,15 +1,30 @@
+import asyncio
+import hashlib
+import secrets
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Any, Union
-from jose import jwt
+from typing import Any, Optional, Union
+from jose import jwt, JWTError
 from passlib.context import CryptContext
+from app.core.cache import CacheBackend, LRUCache, cache_backend
 from app.core.config import settings
+from app.core.metrics import register_metrics
 
 # Настройки (лучше вынести в config.py, но пока оставим тут для краткости)
 SECRET_KEY = "CHANGE_THIS_TO_A_REALLY_STRONG_SECRET" # В продакшене брать из .env!
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# min = max = default: хеш с любой другой стоимостью считается устаревшим и пересчитывается при входе
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -17,8 +32,193 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    # (пароль верен, новый хеш - если стоимость старого не совпадает с BCRYPT_ROUNDS)
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Выполняет bcrypt в отдельном пуле (потоки или процессы, PASSWORD_HASH_EXECUTOR),
+    чтобы хеширование не блокировало event loop. Размер пула - предел одновременных
+    вычислений, остальные ждут в очереди; глубина очереди видна в /metrics.
+    """
+
+    def __init__(self, workers: int, executor_kind: str = "thread"):
+        self.workers = workers
+        self.executor_kind = executor_kind
+        self._executor: Optional[Executor] = None
+        # Вызовы, отправленные в пул и еще не завершенные (выполняются или ждут в очереди)
+        self.in_flight = 0
+        self.active = 0
+        self.max_queued = 0
+        self.calls = 0
+        self.total_ms = 0.0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def _active_and_queued(self) -> tuple[int, int]:
+        if self.executor_kind == "process":
+            # Из другого процесса о старте не сообщить: пул занят первыми workers вызовами, остальные ждут
+            active = min(self.in_flight, self.workers)
+        else:
+            active = self.active
+        return active, self.in_flight - active
+
+    async def _run(self, func, *args):
+        self.in_flight += 1
+        self.max_queued = max(self.max_queued, self._active_and_queued()[1])
+        queued_at = time.perf_counter()
+        started = finished = False
+
+        def mark_started() -> None:
+            nonlocal started
+            # Колбэк может прийти уже после отмены ожидавшего вызова - тогда он не в счет
+            if not finished:
+                started = True
+                self.active += 1
+
+        loop = asyncio.get_running_loop()
+        try:
+            if self.executor_kind == "process":
+                return await loop.run_in_executor(self._get_executor(), func, *args)
+            # Поток пула сообщает о старте через loop: счетчики меняются только в потоке event loop
+            on_start = lambda: loop.call_soon_threadsafe(mark_started)
+            return await loop.run_in_executor(self._get_executor(), _call_started, on_start, func, args)
+        finally:
+            # Выполняется и при отмене ожидающего вызова (CancelledError), счетчики не расползаются
+            finished = True
+            self.in_flight -= 1
+            if started:
+                self.active -= 1
+            self.calls += 1
+            self.total_ms += (time.perf_counter() - queued_at) * 1000
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        return await self._run(verify_and_update_password, plain_password, hashed_password)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats_dict(self) -> dict:
+        active, queued = self._active_and_queued()
+        return {
+            "executor": self.executor_kind,
+            "workers": self.workers,
+            "active": active,
+            "queued": queued,
+            "max_queued": self.max_queued,
+            "calls": self.calls,
+            "avg_ms": round(self.total_ms / self.calls, 2) if self.calls else None,
+        }
+
+
+def _call_started(started, func, args):
+    started()
+    return func(*args)
+
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_EXECUTOR)
+register_metrics("password_hashing", password_hasher.stats_dict)
+
+
 def create_access_token(subject: Union[str, Any]) -> str:
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode = {"exp": expire, "sub": str(subject)}
+    now = datetime.utcnow()
+    expire = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    # iat нужен для отзыва: токены, выданные до revoke_user_tokens, не принимаются.
+    # Дробные секунды - чтобы токен, выданный в ту же секунду сразу после отзыва, оставался валидным
+    to_encode = {"exp": expire, "iat": time.time(), "sub": str(subject)}
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
\ No newline at end of file
+    return encoded_jwt
+
+
+def create_refresh_token() -> str:
+    return secrets.token_urlsafe(32)
+
+
+def hash_refresh_token(token: str) -> str:
+    # У токена 256 бит случайности - достаточно быстрого sha256, медленный bcrypt не нужен
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class AccessTokenCache:
+    """
+    Кэш проверенных access-токенов в памяти процесса: sha256(токен) -> (user_id, iat).
+    Запись живет до exp токена, поэтому повторные запросы с тем же токеном
+    обходятся без проверки подписи и разбора claims.
+    Время отзыва токенов пользователя хранится в общем хранилище (как версия дерева категорий),
+    поэтому отзыв в одном воркере действует во всех.
+    """
+    REVOKED_KEY = "auth:revoked:{}"
+
+    def __init__(self, maxsize: int, backend: CacheBackend):
+        self._cache = LRUCache(maxsize, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+        self.backend = backend
+        self.revocations = 0
+
+    async def decode(self, token: str) -> int:
+        """
+        Возвращает user_id из валидного и не отозванного токена, иначе JWTError.
+        """
+        key = hashlib.sha256(token.encode()).digest()
+        cached = self._cache.get(key)
+        if cached is not None:
+            user_id, issued_at = cached
+        else:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            sub = payload.get("sub")
+            if sub is None:
+                raise JWTError("Token has no subject")
+            try:
+                user_id = int(sub)
+            except ValueError:
+                raise JWTError("Invalid subject")
+            issued_at = payload.get("iat", 0)
+
+            # Токен без exp не кэшируем: его время жизни неизвестно
+            ttl = payload["exp"] - time.time() if "exp" in payload else 0
+            if ttl > 0:
+                self._cache.set(key, (user_id, issued_at), ttl=ttl)
+
+        # Время отзыва - unix time с долями секунды: токены с iat раньше него отклоняются
+        revoked_at = await self.backend.get(self.REVOKED_KEY.format(user_id))
+        if revoked_at is not None and issued_at < float(revoked_at):
+            raise JWTError("Token has been revoked")
+        return user_id
+
+    async def revoke_user_tokens(self, user_id: int) -> None:
+        """
+        Немедленно отзывает все выданные пользователю access-токены во всех воркерах:
+        токены, выданные до этого момента, больше не принимаются.
+        """
+        for key, (cached_user_id, _) in self._cache.items():
+            if cached_user_id == user_id:
+                self._cache.delete(key)
+        # Отметка старше срока жизни токена больше ничего не отсекает - живет столько же
+        await self.backend.set(
+            self.REVOKED_KEY.format(user_id),
+            repr(time.time()).encode(),
+            ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        )
+        self.revocations += 1
+
+    def stats_dict(self) -> dict:
+        return {**self._cache.stats_dict(), "revocations": self.revocations}
+
+
+access_token_cache = AccessTokenCache(settings.ACCESS_TOKEN_CACHE_SIZE, cache_backend)
+register_metrics("access_tokens", access_token_cache.stats_dict)
\ No newline at end of file
@@ -0,0 +1,106 @@
+"""
+Доводит схему существующей БД до моделей. create_all создает только недостающие таблицы,
+а колонки, индексы и ограничения, добавленные в уже существующие таблицы, сам не применит.
+Все шаги идемпотентны (IF NOT EXISTS) и выполняются при каждом запуске после create_all.
+"""
+from typing import Awaitable, Callable
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from app.models.models import CartItem, Order, OrderItem, Product, RefreshToken, User
+
+MigrationStep = Callable[[AsyncConnection], Awaitable[None]]
+
+
+def add_column(model, name: str) -> MigrationStep:
+    # Определение колонки (тип, generated-выражение) берется из модели
+    column = model.__table__.c[name]
+
+    async def step(conn: AsyncConnection) -> None:
+        ddl = CreateColumn(column).compile(dialect=conn.dialect)
+        await conn.execute(text(f"ALTER TABLE {column.table.name} ADD COLUMN IF NOT EXISTS {ddl}"))
+    return step
+
+
+def create_index(model, name: str) -> MigrationStep:
+    index = next(index for index in model.__table__.indexes if index.name == name)
+
+    async def step(conn: AsyncConnection) -> None:
+        await conn.execute(CreateIndex(index, if_not_exists=True))
+    return step
+
+
+def create_unique(model, name: str, columns: str, prepare: tuple[str, ...] = ()) -> MigrationStep:
+    """
+    Уникальное ограничение как уникальный индекс с тем же именем, что дает create_all
+    (ON CONFLICT находит его так же, как ограничение). prepare - SQL, который выполняется
+    перед созданием индекса, например очистка дублей.
+    """
+    table = model.__tablename__
+
+    async def step(conn: AsyncConnection) -> None:
+        if await conn.scalar(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}):
+            return
+        for stmt in prepare:
+            await conn.execute(text(stmt))
+        await conn.execute(text(f"CREATE UNIQUE INDEX {name} ON {table} ({columns})"))
+    return step
+
+
+def execute(stmt: str) -> MigrationStep:
+    async def step(conn: AsyncConnection) -> None:
+        await conn.execute(text(stmt))
+    return step
+
+
+MIGRATIONS: list[MigrationStep] = [
+    # Keyset-пагинация поиска
+    create_index(Product, "ix_products_price_id"),
+    create_index(Product, "ix_products_category_price_id"),
+    create_index(Product, "ix_products_category_id_id"),
+    # Фильтры по характеристикам
+    create_index(Product, "ix_products_specs_gin"),
+    # Полнотекстовый и триграммный поиск (generated-колонка пересчитается для всех строк)
+    add_column(Product, "search_vector"),
+    create_index(Product, "ix_products_search_vector"),
+    create_index(Product, "ix_products_name_trgm"),
+    # Массовый импорт: артикул - ключ upsert
+    add_column(Product, "sku"),
+    create_unique(Product, "products_sku_key", "sku"),
+    # Upsert позиций корзины: раньше один товар мог лежать несколькими строками - сливаем их в первую
+    create_unique(CartItem, "uq_cart_items_cart_product", "cart_id, product_id", prepare=(
+        """
+        UPDATE cart_items AS c SET quantity = d.total
+        FROM (
+            SELECT min(id) AS keep_id, sum(quantity) AS total
+            FROM cart_items GROUP BY cart_id, product_id HAVING count(*) > 1
+        ) AS d
+        WHERE c.id = d.keep_id
+        """,
+        """
+        DELETE FROM cart_items AS c USING cart_items AS k
+        WHERE k.cart_id = c.cart_id AND k.product_id = c.product_id AND k.id < c.id
+        """,
+    )),
+    # Idempotency-Key при оформлении заказа
+    add_column(Order, "idempotency_key"),
+    create_unique(Order, "uq_orders_user_idempotency_key", "user_id, idempotency_key"),
+    # История заказов
+    create_index(Order, "ix_orders_user_created_id"),
+    create_index(OrderItem, "ix_order_items_order_id"),
+    # Вход через провайдеров: пользователи без пароля и upsert по (provider, provider_user_id)
+    add_column(User, "provider"),
+    add_column(User, "provider_user_id"),
+    add_column(User, "last_login_at"),
+    execute("ALTER TABLE users ALTER COLUMN hashed_password DROP NOT NULL"),
+    create_unique(User, "uq_users_provider_identity", "provider, provider_user_id"),
+    # Очистка просроченных refresh-токенов
+    create_index(RefreshToken, "ix_refresh_tokens_expires_at"),
+]
+
+
+async def apply_schema_migrations(conn: AsyncConnection) -> None:
+    for step in MIGRATIONS:
+        await step(conn)
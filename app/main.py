@@ -1,11 +1,22 @@
+import asyncio
+
 import uvicorn
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
+from sqlalchemy import text
 
-from app.db.session import engine, Base
-from app.api.v1 import categories, products, cart, orders, auth
+from app.db.session import engine, Base, AsyncSessionLocal
+from app.db.migrations import apply_schema_migrations
+from app.api.v1 import categories, products, cart, orders, auth, analytics
 from starlette.middleware.sessions import SessionMiddleware
 from app.core.config import settings
+from app.core.metrics import collect_metrics
+from app.services.category_service import CategoryService
+from app.services.sales_rollup_service import SalesRollupService
+from app.services.outbox_service import outbox_worker
+from app.core.security import password_hasher
+from app.core.oauth import init_oauth_clients, close_oauth_clients
+from app.services.token_service import purge_refresh_tokens_periodically
 
 from fastapi.responses import HTMLResponse
 from app.core.config import settings
@@ -15,11 +26,30 @@ from app.core.config import settings
 async def lifespan(app: FastAPI):
     # Создаем таблицы в БД при запуске (если их нет)
     async with engine.begin() as conn:
+        # Триграммный индекс по названию товара требует pg_trgm
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
         # await conn.run_sync(Base.metadata.drop_all) # Раскомментировать для сброса БД
         await conn.run_sync(Base.metadata.create_all)
+        # Новые колонки и индексы в таблицах, созданных до их появления
+        await apply_schema_migrations(conn)
+    # Досчитываем иерархию категорий, если таблица замыкания пуста или отстала
+    async with AsyncSessionLocal() as session:
+        await CategoryService(session).ensure_closure()
+        # Агрегаты продаж по уже существующим заказам
+        await SalesRollupService(session).ensure_rollups()
     print("Database ready.")
+    # OAuth-клиенты провайдеров с общим пулом соединений
+    init_oauth_clients()
+    # Фоновая обработка outbox (события после checkout и т.п.)
+    outbox_worker.start()
+    # Очистка просроченных refresh-токенов
+    purge_task = asyncio.create_task(purge_refresh_tokens_periodically(settings.REFRESH_TOKEN_PURGE_INTERVAL))
     yield
     print("Shutting down.")
+    purge_task.cancel()
+    await outbox_worker.stop()
+    await close_oauth_clients()
+    password_hasher.shutdown()
 
 app = FastAPI(
     title="Fur Shop API",
@@ -35,6 +65,7 @@ app.include_router(products.router, prefix="/api/v1/products", tags=["Products"]
 app.include_router(cart.router, prefix="/api/v1/cart", tags=["Cart"])
 app.include_router(orders.router, prefix="/api/v1/orders", tags=["Orders"])
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["Auth"])
+app.include_router(analytics.router, prefix="/api/v1/analytics", tags=["Analytics"])
 
 # Простой эндпоинт для проверки здоровья
 @app.get("/health")
@@ -42,6 +73,12 @@ async def health_check():
     return {"status": "ok"}
 
 
+# Счетчики кэшей и пулов (hit rate, время пересборки и т.п.)
+@app.get("/metrics")
+async def metrics():
+    return collect_metrics()
+
+
 @app.get("/login_test", response_class=HTMLResponse)
 async def telegram_test_page():
     bot_name = "meha_shubi_auth_bot"
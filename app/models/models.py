@@ -1,10 +1,13 @@
 import datetime
 from typing import List, Optional
-from sqlalchemy import String, ForeignKey, Integer, Float, DateTime, func, Text
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import String, ForeignKey, Integer, Float, Date, DateTime, func, text, Text, Index, Computed, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.db.session import Base
 
+# Конфигурация полнотекстового поиска (морфология русского языка)
+FTS_CONFIG = "russian"
+
 
 # --- USER ---
 class User(Base):
@@ -12,11 +15,21 @@ class User(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True)
     email: Mapped[str] = mapped_column(String, unique=True, index=True)
-    hashed_password: Mapped[str] = mapped_column(String)
+    # None у пользователей, входящих только через Telegram / соцсети
+    hashed_password: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    # Внешняя учетная запись: ("telegram", telegram id), ("vk", id), ("yandex", id)
+    provider: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    provider_user_id: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    last_login_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
 
     cart: Mapped["Cart"] = relationship(back_populates="user", uselist=False)
     orders: Mapped[List["Order"]] = relationship(back_populates="user")
 
+    __table_args__ = (
+        # Вход через провайдера - один upsert по этому уникальному индексу
+        UniqueConstraint("provider", "provider_user_id", name="uq_users_provider_identity"),
+    )
+
 
 # --- CATEGORY ---
 class Category(Base):
@@ -34,11 +47,26 @@ class Category(Base):
     products: Mapped[List["Product"]] = relationship(back_populates="category")
 
 
+class CategoryClosure(Base):
+    """
+    Таблица замыкания иерархии категорий: по строке на каждую пару (предок, потомок),
+    включая саму категорию с depth=0. Поддерживается в CategoryService.create_category.
+    Поддерево любой глубины выбирается одним индексным запросом по ancestor_id.
+    """
+    __tablename__ = "category_closure"
+
+    ancestor_id: Mapped[int] = mapped_column(ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True)
+    descendant_id: Mapped[int] = mapped_column(ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True, index=True)
+    depth: Mapped[int] = mapped_column(Integer)
+
+
 # --- PRODUCT ---
 class Product(Base):
     __tablename__ = "products"
 
     id: Mapped[int] = mapped_column(primary_key=True)
+    # Внешний артикул (из каталога поставщика). Ключ upsert при массовом импорте
+    sku: Mapped[Optional[str]] = mapped_column(String, unique=True, nullable=True)
     name: Mapped[str] = mapped_column(String, index=True)
     description: Mapped[Optional[str]] = mapped_column(Text)  # Сгенерировано LLM
     price: Mapped[float] = mapped_column(Float)
@@ -50,6 +78,31 @@ class Product(Base):
     category_id: Mapped[int] = mapped_column(ForeignKey("categories.id"))
     category: Mapped["Category"] = relationship(back_populates="products")
 
+    # Поисковый вектор поддерживает сама БД (generated column), название весит больше описания.
+    # deferred: в обычных SELECT колонка не читается
+    search_vector: Mapped[Optional[str]] = mapped_column(
+        TSVECTOR,
+        Computed(
+            f"setweight(to_tsvector('{FTS_CONFIG}', coalesce(name, '')), 'A') || "
+            f"setweight(to_tsvector('{FTS_CONFIG}', coalesce(description, '')), 'B')",
+            persisted=True,
+        ),
+        deferred=True,
+    )
+
+    __table_args__ = (
+        # Индексы под keyset-пагинацию поиска: порядок колонок совпадает с ORDER BY,
+        # так что и price_asc, и price_desc (обратный проход) читают ровно одну страницу
+        Index("ix_products_price_id", "price", "id"),
+        Index("ix_products_category_price_id", "category_id", "price", "id"),
+        Index("ix_products_category_id_id", "category_id", "id"),
+        # GIN по характеристикам: обслуживает @> (точные значения) и @? (jsonpath-диапазоны)
+        Index("ix_products_specs_gin", "specs", postgresql_using="gin"),
+        # Полнотекстовый поиск и триграммный поиск с опечатками (нужно расширение pg_trgm)
+        Index("ix_products_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_products_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+    )
+
 
 # --- CART ---
 class Cart(Base):
@@ -73,6 +126,11 @@ class CartItem(Base):
     cart: Mapped["Cart"] = relationship(back_populates="items")
     product: Mapped["Product"] = relationship()  # Односторонняя связь достаточна
 
+    __table_args__ = (
+        # Один товар - одна позиция в корзине. Ключ для атомарного upsert в CartService.add_item
+        UniqueConstraint("cart_id", "product_id", name="uq_cart_items_cart_product"),
+    )
+
 
 # --- ORDER ---
 class Order(Base):
@@ -83,10 +141,20 @@ class Order(Base):
     created_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     status: Mapped[str] = mapped_column(String, default="pending")
     total_price: Mapped[float] = mapped_column(Float)
+    # Ключ из заголовка Idempotency-Key: повтор checkout с тем же ключом вернет этот заказ
+    idempotency_key: Mapped[Optional[str]] = mapped_column(String, nullable=True)
 
     user: Mapped["User"] = relationship(back_populates="orders")
     items: Mapped[List["OrderItem"]] = relationship(back_populates="order")
 
+    __table_args__ = (
+        # Ключ уникален в пределах пользователя; индекс обслуживает поиск повтора
+        UniqueConstraint("user_id", "idempotency_key", name="uq_orders_user_idempotency_key"),
+        # История заказов: keyset по (created_at, id) внутри пользователя. ORDER BY ... DESC
+        # читает индекс обратным проходом; INCLUDE дает index-only scan для краткого списка
+        Index("ix_orders_user_created_id", "user_id", "created_at", "id", postgresql_include=["status", "total_price"]),
+    )
+
 
 class OrderItem(Base):
     """
@@ -96,9 +164,100 @@ class OrderItem(Base):
     __tablename__ = "order_items"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    order_id: Mapped[int] = mapped_column(ForeignKey("orders.id"))
+    order_id: Mapped[int] = mapped_column(ForeignKey("orders.id"), index=True)
     product_id: Mapped[int] = mapped_column(ForeignKey("products.id"))
     quantity: Mapped[int] = mapped_column(Integer)
     price_at_purchase: Mapped[float] = mapped_column(Float)  # Цена на момент заказа
 
-    order: Mapped["Order"] = relationship(back_populates="items")
\ No newline at end of file
+    order: Mapped["Order"] = relationship(back_populates="items")
+
+
+# --- SALES ROLLUPS ---
+class DailySales(Base):
+    """
+    Агрегат продаж по дням (UTC). Обновляется инкрементально при оформлении заказа,
+    см. SalesRollupService.
+    """
+    __tablename__ = "daily_sales"
+
+    day: Mapped[datetime.date] = mapped_column(Date, primary_key=True)
+    order_count: Mapped[int] = mapped_column(Integer, default=0)
+    revenue: Mapped[float] = mapped_column(Float, default=0)
+
+
+class ProductDailySales(Base):
+    """
+    Продажи товара за день: проданные единицы и выручка по цене на момент покупки.
+    """
+    __tablename__ = "product_daily_sales"
+
+    day: Mapped[datetime.date] = mapped_column(Date, primary_key=True)
+    product_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    units: Mapped[int] = mapped_column(Integer, default=0)
+    revenue: Mapped[float] = mapped_column(Float, default=0)
+
+    __table_args__ = (
+        # Динамика продаж одного товара; топ за период читается по первичному ключу (day, product_id)
+        Index("ix_product_daily_sales_product_day", "product_id", "day"),
+    )
+
+
+class SalesRollupOrder(Base):
+    """
+    Заказы, уже учтенные в агрегатах: обработчик outbox может выполниться повторно,
+    а заказ должен попасть в агрегаты ровно один раз.
+    """
+    __tablename__ = "sales_rollup_orders"
+
+    order_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+
+# --- OUTBOX ---
+class OutboxEvent(Base):
+    """
+    Transactional outbox: событие пишется в той же транзакции, что и породившие его данные,
+    и обрабатывается позже фоновым OutboxWorker.
+    """
+    __tablename__ = "outbox_events"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    event_type: Mapped[str] = mapped_column(String)
+    payload: Mapped[dict] = mapped_column(JSONB, default={})
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    # pending -> done | failed (исчерпаны попытки)
+    status: Mapped[str] = mapped_column(String, default="pending", server_default="pending")
+    attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    # Раньше этого времени событие не берется (аренда воркером или пауза перед повтором)
+    available_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    processed_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    __table_args__ = (
+        # Очередь на обработку: частичный индекс только по необработанным событиям
+        Index(
+            "ix_outbox_events_pending", "available_at", "id",
+            postgresql_where=text("status = 'pending'"),
+        ),
+    )
+
+
+# --- REFRESH TOKENS ---
+class RefreshToken(Base):
+    """
+    Refresh-токен хранится только как sha256 (сам токен - случайная строка, bcrypt не нужен).
+    Токены одной цепочки ротации делят family_id: повторное использование уже
+    обмененного токена отзывает всю цепочку.
+    """
+    __tablename__ = "refresh_tokens"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
+    token_hash: Mapped[str] = mapped_column(String, unique=True, index=True)
+    family_id: Mapped[str] = mapped_column(String, index=True)
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    # Индекс - для периодической очистки просроченных токенов
+    expires_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), index=True)
+    # Когда токен обменян на новый (ротация) и когда отозван
+    used_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    revoked_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
@@ -0,0 +1,36 @@
+import datetime
+from pydantic import BaseModel, ConfigDict
+from typing import List, Optional
+
+
+class DailySalesRead(BaseModel):
+    day: datetime.date
+    order_count: int
+    revenue: float
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class SalesReport(BaseModel):
+    date_from: datetime.date
+    date_to: datetime.date
+    order_count: int  # итог за период
+    revenue: float
+    days: List[DailySalesRead]
+
+
+class ProductSalesRead(BaseModel):
+    product_id: int
+    name: Optional[str] = None  # None, если товар уже удален из каталога
+    units: int
+    revenue: float
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ProductDailySalesRead(BaseModel):
+    day: datetime.date
+    units: int
+    revenue: float
+
+    model_config = ConfigDict(from_attributes=True)
@@ -1,10 +1,13 @@
-from pydantic import BaseModel, ConfigDict, Field
+from enum import Enum
+from typing import Optional
+
+from pydantic import BaseModel, ConfigDict, Field, model_validator, computed_field
 from app.schemas.product import ProductRead
 
 
 class CartItemBase(BaseModel):
     product_id: int
-    quantity: int = 1
+    quantity: int = Field(1, gt=0)
 
 
 class CartItemUpdate(BaseModel):
@@ -23,7 +26,8 @@ class CartRead(BaseModel):
     id: int
     items: list[CartItemRead] = []
 
-    # Вычисляемое поле для удобства фронтенда
+    # Вычисляемое поле для удобства фронтенда (попадает в JSON ответа)
+    @computed_field
     @property
     def total_price(self) -> float:
         return sum(item.product.price * item.quantity for item in self.items)
@@ -33,4 +37,33 @@ class CartRead(BaseModel):
 
 class CartItemUpdate(BaseModel):
     product_id: int
-    quantity: int = Field(..., gt=0) # Количество должно быть больше 0
\ No newline at end of file
+    quantity: int = Field(..., gt=0) # Количество должно быть больше 0
+
+
+class CartSummary(BaseModel):
+    item_count: int  # всего единиц товара
+    distinct_products: int
+    total_price: float
+
+
+class CartOperationType(str, Enum):
+    ADD = "add"        # увеличить количество на quantity
+    SET = "set"        # выставить количество quantity
+    REMOVE = "remove"  # убрать товар из корзины
+
+
+class CartOperation(BaseModel):
+    op: CartOperationType
+    product_id: int
+    quantity: Optional[int] = Field(None, gt=0)
+
+    @model_validator(mode="after")
+    def check_quantity(self):
+        if self.op != CartOperationType.REMOVE and self.quantity is None:
+            raise ValueError(f"quantity is required for '{self.op.value}'")
+        return self
+
+
+class CartBatchRequest(BaseModel):
+    # Применяются по порядку, все вместе в одной транзакции
+    operations: list[CartOperation] = Field(..., min_length=1, max_length=500)
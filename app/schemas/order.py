@@ -1,6 +1,6 @@
 import datetime
 from pydantic import BaseModel, ConfigDict
-from typing import List
+from typing import List, Optional
 
 
 class OrderItemRead(BaseModel):
@@ -18,4 +18,27 @@ class OrderRead(BaseModel):
     total_price: float
     items: List[OrderItemRead]
 
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+
+class OrderSummary(BaseModel):
+    """
+    Краткая строка истории заказов без позиций.
+    """
+    id: int
+    created_at: datetime.datetime
+    status: str
+    total_price: float
+    item_count: int  # всего единиц товара в заказе
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class OrderPage(BaseModel):
+    items: List[OrderRead]
+    next_cursor: Optional[str] = None
+
+
+class OrderSummaryPage(BaseModel):
+    items: List[OrderSummary]
+    next_cursor: Optional[str] = None
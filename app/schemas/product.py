@@ -1,5 +1,6 @@
-from typing import Optional, Dict, Any
-from pydantic import BaseModel, ConfigDict, Field
+import json
+from typing import Optional, Dict, Any, List
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from enum import Enum
 
 
@@ -13,10 +14,12 @@ class ProductBase(BaseModel):
 class ProductCreate(ProductBase):
     # Теперь мы явно ждем описание от фронтенда (оно может быть пустым)
     description: Optional[str] = None
+    sku: Optional[str] = None
 
 
 class ProductRead(ProductBase):
     id: int
+    sku: Optional[str] = None
     image_url: Optional[str] = None
     description: Optional[str] = None
 
@@ -30,22 +33,97 @@ class SortOption(str, Enum):
     PRICE_ASC = "price_asc"
     PRICE_DESC = "price_desc"
     NEWEST = "newest"
+    RELEVANCE = "relevance"
+
+
+class SpecRange(BaseModel):
+    min: Optional[float] = Field(None, allow_inf_nan=False)
+    max: Optional[float] = Field(None, allow_inf_nan=False)
 
 
 class ProductFilter(BaseModel):
+    # Строка поиска по названию и описанию (полнотекстовый + нечеткий поиск)
+    q: Optional[str] = Field(None, max_length=200)
     category_id: Optional[int] = None
+    # Искать и во всех подкатегориях category_id
+    include_descendants: bool = False
     price_min: Optional[float] = None
     price_max: Optional[float] = None
-    # Фильтр по JSON характеристикам (например, {"color": "black"})
-    # В реальном проекте это часто реализуют сложнее, но для базы хватит
+    # Фильтр по JSON характеристикам, точное совпадение с учетом типа (например, {"color": "black"})
     specs_filter: Optional[Dict[str, Any]] = None
+    # "Любое из" списка значений (например, {"color": ["black", "white"]})
+    specs_any: Optional[Dict[str, List[Any]]] = None
+    # Числовые диапазоны (например, {"length_cm": {"min": 80, "max": 110}})
+    specs_range: Optional[Dict[str, SpecRange]] = None
 
-    sort_by: SortOption = SortOption.NEWEST
+    # По умолчанию: relevance, если задан q, иначе newest
+    sort_by: Optional[SortOption] = None
     page: int = 1
     limit: int = 10
+    # Курсор keyset-пагинации (next_cursor из прошлого ответа).
+    # Если передан, page игнорируется и выборка идет "после" курсора без OFFSET
+    cursor: Optional[str] = None
+
+    # Ответ-страница {items, next_cursor, facets} вместо списка товаров.
+    # Включается сам, если передан cursor или facets; без них ответ - список, как раньше
+    paginated: bool = False
+
+    # Вернуть фасеты (счетчики для сайдбара фильтров) вместе со страницей
+    facets: bool = False
+    price_buckets: int = Field(10, ge=1, le=50)
+
+    @field_validator("q")
+    @classmethod
+    def strip_query(cls, v: Optional[str]) -> Optional[str]:
+        # Пустая строка поиска равносильна ее отсутствию
+        if v is None:
+            return None
+        return v.strip() or None
+
+
+class FacetValue(BaseModel):
+    value: Any
+    count: int
+
+
+class CategoryFacet(BaseModel):
+    category_id: int
+    count: int
+
+
+class PriceBucket(BaseModel):
+    min: float
+    max: float
+    count: int
+
+
+class ProductFacets(BaseModel):
+    specs: Dict[str, List[FacetValue]] = {}
+    categories: List[CategoryFacet] = []
+    price: List[PriceBucket] = []
+
+
+class ProductPage(BaseModel):
+    items: List[ProductRead]
+    # None, если дальше товаров нет
+    next_cursor: Optional[str] = None
+    # Заполняется, только если в фильтре передан facets=true
+    facets: Optional[ProductFacets] = None
+
+
+class ProductBatchRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=200)
+
+
+class ProductBatchResponse(BaseModel):
+    # В порядке запроса (повторы id схлопываются)
+    items: List[ProductRead]
+    # id, которых нет в каталоге
+    missing: List[int] = []
 
 
 class ProductUpdate(BaseModel):
+    sku: Optional[str] = None
     name: Optional[str] = None
     price: Optional[float] = None
     description: Optional[str] = None
@@ -54,6 +132,56 @@ class ProductUpdate(BaseModel):
     image_url: Optional[str] = None
 
 
+# Формат файла каталога для импорта и экспорта
+class CatalogFormat(str, Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+
+class ProductImportRow(ProductCreate):
+    """
+    Строка массового импорта: тот же ProductCreate, но артикул обязателен.
+    """
+    sku: str = Field(..., min_length=1)
+    image_url: Optional[str] = None
+
+    @field_validator("specs", mode="before")
+    @classmethod
+    def parse_specs(cls, v: Any) -> Any:
+        # В CSV характеристики приходят JSON-строкой
+        if isinstance(v, str):
+            return json.loads(v) if v.strip() else {}
+        return v
+
+    @field_validator("description", "image_url", mode="before")
+    @classmethod
+    def empty_to_none(cls, v: Any) -> Any:
+        return v or None
+
+
+class ImportRowError(BaseModel):
+    row: int  # номер строки (записи) в файле, с 1
+    error: str
+
+
+class ImportBatchReport(BaseModel):
+    batch: int
+    rows: int
+    upserted: int
+    failed: int = 0
+    # Не больше MAX_REPORTED_ERRORS на весь отчет; полное число ошибок - в failed
+    errors: List[ImportRowError] = []
+
+
+class ProductImportReport(BaseModel):
+    total_rows: int = 0
+    upserted: int = 0
+    failed: int = 0
+    # true, если в отчет попали не все ошибки строк
+    errors_truncated: bool = False
+    batches: List[ImportBatchReport] = []
+
+
 class GenerateDescriptionRequest(BaseModel):
     name: str
     specs: Dict[str, Any]
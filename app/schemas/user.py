@@ -1,13 +1,35 @@
-from pydantic import BaseModel, EmailStr
+from typing import Optional
+from pydantic import BaseModel, EmailStr, field_validator
+
+# Технический домен email пользователей Telegram ("<telegram id>@telegram.user")
+TELEGRAM_EMAIL_DOMAIN = "telegram.user"
+
+
+def telegram_email(telegram_id: int) -> str:
+    return f"{telegram_id}@{TELEGRAM_EMAIL_DOMAIN}"
+
 
 class UserCreate(BaseModel):
     email: EmailStr
     password: str
 
+    @field_validator("email")
+    @classmethod
+    def reject_reserved_domain(cls, v: str) -> str:
+        # Иначе можно заранее занять email чужого Telegram-аккаунта и получить его при первом входе
+        if v.lower().endswith("@" + TELEGRAM_EMAIL_DOMAIN):
+            raise ValueError("This email domain is reserved")
+        return v
+
 class UserRead(BaseModel):
     id: int
     email: EmailStr
 
 class Token(BaseModel):
     access_token: str
-    token_type: str
\ No newline at end of file
+    token_type: str
+    # Обменивается на новую пару в /auth/refresh (одноразовый, ротация)
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
\ No newline at end of file
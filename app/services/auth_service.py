@@ -1,11 +1,12 @@
-import uuid
 from starlette.requests import Request
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.oauth import oauth
-from app.core.security import create_access_token
-from app.schemas.user import UserCreate, Token
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.oauth import get_oauth_client, call_provider
+from app.schemas.user import Token
+from app.api.deps import merge_guest_cart
+from app.services.token_service import TokenService
 from app.services.user_service import UserService
 
 
@@ -18,7 +19,8 @@ class AuthService:
         """
         Генерирует редирект на сайт провайдера.
         """
-        client = oauth.create_client(provider)
+        # Клиенты создаются один раз при старте (init_oauth_clients)
+        client = get_oauth_client(provider)
         if not client:
             raise HTTPException(status_code=400, detail=f"Provider {provider} not supported")
 
@@ -40,36 +42,46 @@ class AuthService:
         """
         Обрабатывает callback, получает email, создает юзера (если надо) и выдает токен.
         """
-        client = oauth.create_client(provider)
+        client = get_oauth_client(provider)
         if not client:
             raise HTTPException(status_code=400, detail="Unknown provider")
 
         from app.core.config import settings
-        client = oauth.create_client(provider)
 
         request.scope["starlette.app"].state.redirect_uri = f"{settings.BASE_URL}/api/v1/auth/callback/{provider}"
 
         try:
-            # Обмениваем код на токен
-            token = await client.authorize_access_token(request)
+            # Обмениваем код на токен (через предохранитель провайдера, с таймаутами клиента)
+            token = await call_provider(provider, lambda: client.authorize_access_token(request))
+        except CircuitOpenError:
+            raise HTTPException(status_code=503, detail=f"{provider} is temporarily unavailable")
         except Exception as e:
             print(f"OAuth Error: {e}")
             raise HTTPException(status_code=400, detail="OAuth connection error")
 
         user_email = None
+        provider_user_id = None
 
         # --- Специфика VK ---
         if provider == 'vk':
             # VK часто отдает email прямо в ответе с токеном
             user_email = token.get('email')
+            provider_user_id = token.get('user_id')
 
         # --- Специфика Yandex ---
         elif provider == 'yandex':
             # Yandex требует отдельного запроса за инфо
-            try:
+            async def fetch_info():
                 resp = await client.get('info', token=token)
-                user_info = resp.json()
+                resp.raise_for_status()
+                return resp.json()
+
+            try:
+                user_info = await call_provider(provider, fetch_info)
                 user_email = user_info.get('default_email')
+                provider_user_id = user_info.get('id')
+            except CircuitOpenError:
+                raise HTTPException(status_code=503, detail=f"{provider} is temporarily unavailable")
             except Exception:
                 raise HTTPException(status_code=400, detail="Failed to fetch user info from Yandex")
 
@@ -77,17 +89,17 @@ class AuthService:
         if not user_email:
             raise HTTPException(status_code=400, detail=f"Could not retrieve email from {provider}")
 
-        # --- Логика Users (Find or Create) ---
-        user = await self.user_service.get_by_email(user_email)
+        if not provider_user_id:
+            raise HTTPException(status_code=400, detail=f"Could not retrieve user id from {provider}")
+
+        # --- Логика Users (Find or Create): один upsert, без пароля ---
+        try:
+            user = await self.user_service.get_or_create_external_user(provider, str(provider_user_id), user_email)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-        if not user:
-            # Создаем нового пользователя с рандомным паролем
-            random_password = str(uuid.uuid4())
-            user_in = UserCreate(email=user_email, password=random_password)
-            user = await self.user_service.create_user(user_in)
+        # --- Гостевая корзина из сессии переезжает в корзину пользователя ---
+        await merge_guest_cart(request, self.db, user.id)
 
-        # --- Выдача токена ---
-        return {
-            "access_token": create_access_token(user.id),
-            "token_type": "bearer",
-        }
\ No newline at end of file
+        # --- Выдача токенов ---
+        return await TokenService(self.db).issue_tokens(user.id)
\ No newline at end of file
@@ -1,83 +1,107 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
 
-from app.models.models import Cart, CartItem, Product
-
-
-class CartService:
-    def __init__(self, db: AsyncSession):
-        self.db = db
-
-    async def get_or_create_cart(self, user_id: int) -> Cart:
-        # Ищем корзину пользователя
-        query = (
-            select(Cart)
-            .where(Cart.user_id == user_id)
-            .options(
-                selectinload(Cart.items).selectinload(CartItem.product)
-            )
-        )
-        result = await self.db.execute(query)
-        cart = result.scalar_one_or_none()
-
-        if not cart:
-            cart = Cart(user_id=user_id)
-            self.db.add(cart)
-            await self.db.commit()
-            # Рефреш нужен, чтобы подтянуть ID и пустой список items
-            await self.db.refresh(cart, attribute_names=["items"])
-
-        return cart
-
-    async def add_item(self, user_id: int, product_id: int, quantity: int):
-        cart = await self.get_or_create_cart(user_id)
-
-        # Проверяем, есть ли уже этот товар в корзине
-        existing_item = next((item for item in cart.items if item.product_id == product_id), None)
-
-        if existing_item:
-            existing_item.quantity += quantity
+from app.core.cache import cache_backend
+from app.schemas.cart import CartOperation, CartOperationType
+from app.services.cart_storage import CartOwner, CartStorage, KeyValueCartStorage, Lines, get_cart_storage
+
+
+def fold_operations(operations: list[CartOperation]) -> tuple[list[int], Lines, Lines]:
+    """
+    Сворачивает операции (по порядку) в итоговое действие по каждому товару:
+    (удалить, выставить количество, прибавить к текущему количеству).
+    """
+    # product_id -> ("delta", n): прибавить n к текущему количеству
+    #               ("absolute", n): выставить n (0 - удалить позицию)
+    actions: dict[int, tuple[str, int]] = {}
+    for operation in operations:
+        kind, value = actions.get(operation.product_id, ("delta", 0))
+        if operation.op == CartOperationType.ADD:
+            actions[operation.product_id] = (kind, value + operation.quantity)
+        elif operation.op == CartOperationType.SET:
+            actions[operation.product_id] = ("absolute", operation.quantity)
         else:
-            new_item = CartItem(cart_id=cart.id, product_id=product_id, quantity=quantity)
-            self.db.add(new_item)
+            actions[operation.product_id] = ("absolute", 0)
 
-        await self.db.commit()
+    removed = [pid for pid, (kind, value) in actions.items() if kind == "absolute" and value == 0]
+    absolute = [(pid, value) for pid, (kind, value) in actions.items() if kind == "absolute" and value > 0]
+    delta = [(pid, value) for pid, (kind, value) in actions.items() if kind == "delta" and value > 0]
+    return removed, absolute, delta
 
-        # ВАЖНОЕ ИЗМЕНЕНИЕ:
-        # Вместо refresh(cart), который не подгружает вложенный product у нового item,
-        # мы просто заново запрашиваем полную корзину со всеми связями.
-        # Это гарантирует, что у всех items будет загружен product.
-        return await self.get_or_create_cart(user_id)
 
-    async def clear_cart(self, user_id: int):
-        cart = await self.get_or_create_cart(user_id)
-        # Удаляем все элементы корзины
-        for item in cart.items:
-            await self.db.delete(item)
-        await self.db.commit()
+class CartService:
+    """
+    Бизнес-логика корзины поверх подключаемого хранилища (SQL или KV, см. get_cart_storage).
+    Гостевые корзины (owner = "guest:<session id>") всегда живут в KV-хранилище
+    и сливаются в корзину пользователя при входе.
+    """
 
-    async def update_item_quantity(self, user_id: int, product_id: int, quantity: int):
-        cart = await self.get_or_create_cart(user_id)
+    def __init__(self, db: AsyncSession, storage: CartStorage | None = None):
+        self.db = db
+        self.storage = storage or get_cart_storage(db)
+        self.guest_storage = KeyValueCartStorage(db, cache_backend)
 
-        # Ищем товар в корзине (в памяти, т.к. cart.items уже загружены)
-        item_to_update = next((item for item in cart.items if item.product_id == product_id), None)
+    def _storage_for(self, owner: CartOwner) -> CartStorage:
+        return self.storage if isinstance(owner, int) else self.guest_storage
 
-        if item_to_update:
-            item_to_update.quantity = quantity
-            self.db.add(item_to_update)
-            await self.db.commit()
+    async def get_or_create_cart(self, owner: CartOwner):
+        return await self._storage_for(owner).get_cart(owner)
 
-        # Возвращаем полную корзину, чтобы обновились итоги
-        return await self.get_or_create_cart(user_id)
+    async def get_summary(self, owner: CartOwner) -> dict:
+        """
+        Итоги корзины без загрузки позиций и карточек товаров
+        (в SQL-хранилище - одним агрегирующим запросом cart_items JOIN products).
+        """
+        return await self._storage_for(owner).get_summary(owner)
 
-    async def remove_item(self, user_id: int, product_id: int):
-        cart = await self.get_or_create_cart(user_id)
+    async def add_item(self, owner: CartOwner, product_id: int, quantity: int):
+        storage = self._storage_for(owner)
+        await storage.add_item(owner, product_id, quantity)
+        return await storage.get_cart(owner)
 
-        item_to_remove = next((item for item in cart.items if item.product_id == product_id), None)
+    async def clear_cart(self, owner: CartOwner):
+        await self._storage_for(owner).clear_cart(owner)
 
-        if item_to_remove:
-            await self.db.delete(item_to_remove)
-            await self.db.commit()
+    async def update_item_quantity(self, owner: CartOwner, product_id: int, quantity: int):
+        storage = self._storage_for(owner)
+        await storage.update_item_quantity(owner, product_id, quantity)
 
-        return await self.get_or_create_cart(user_id)
\ No newline at end of file
+        # Возвращаем полную корзину, чтобы обновились итоги
+        return await storage.get_cart(owner)
+
+    async def remove_item(self, owner: CartOwner, product_id: int):
+        storage = self._storage_for(owner)
+        await storage.remove_item(owner, product_id)
+        return await storage.get_cart(owner)
+
+    async def apply_operations(self, owner: CartOwner, operations: list[CartOperation]):
+        """
+        Применяет пачку операций add/set/remove атомарно.
+        Операции сначала сворачиваются в итоговое действие по каждому товару,
+        затем хранилище применяет их разом (в SQL - не более чем тремя set-based запросами).
+        """
+        removed, absolute, delta = fold_operations(operations)
+
+        storage = self._storage_for(owner)
+        await storage.apply_actions(owner, removed, absolute, delta)
+        return await storage.get_cart(owner)
+
+    async def merge_guest_cart(self, guest: str, user_id: int) -> None:
+        """
+        Переносит гостевую корзину в корзину пользователя (количества складываются).
+        """
+        lines = await self.guest_storage.take_lines(guest)
+        if not lines:
+            return
+        try:
+            await self.storage.apply_actions(user_id, [], [], list(lines.items()))
+        except ValueError as e:
+            # Товар из гостевой корзины успели удалить из каталога - корзину не теряем
+            print(f"Guest cart merge error: {e}")
+            await self.guest_storage.put_back(guest, lines)
+
+    async def prepare_checkout(self, user_id: int) -> dict[int, int] | None:
+        return await self.storage.prepare_checkout(user_id)
+
+    async def restore_checkout(self, user_id: int, lines: dict[int, int] | None) -> None:
+        if lines:
+            await self.storage.restore_checkout(user_id, lines)
@@ -0,0 +1,328 @@
+from typing import Union
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, delete, literal, func, Integer
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+
+from app.core.cache import CacheBackend, cache_backend
+from app.core.config import settings
+from app.models.models import Cart, CartItem, Product
+from app.services.product_service import ProductService
+
+# Владелец корзины: user_id (int) или гостевая сессия ("guest:<session id>")
+CartOwner = Union[int, str]
+
+# Действия над позициями после свертки операций (см. CartService.apply_operations)
+Lines = list[tuple[int, int]]
+
+
+class CartStorage:
+    """
+    Базовый интерфейс хранилища корзин.
+    Мутации возвращают None; актуальную корзину отдает get_cart.
+    """
+
+    async def get_cart(self, owner: CartOwner):
+        raise NotImplementedError
+
+    async def get_summary(self, owner: CartOwner) -> dict:
+        raise NotImplementedError
+
+    async def add_item(self, owner: CartOwner, product_id: int, quantity: int) -> None:
+        raise NotImplementedError
+
+    async def update_item_quantity(self, owner: CartOwner, product_id: int, quantity: int) -> None:
+        raise NotImplementedError
+
+    async def remove_item(self, owner: CartOwner, product_id: int) -> None:
+        raise NotImplementedError
+
+    async def clear_cart(self, owner: CartOwner) -> None:
+        raise NotImplementedError
+
+    async def apply_actions(self, owner: CartOwner, removed: list[int], absolute: Lines, delta: Lines) -> None:
+        """
+        Атомарно: удалить позиции removed, выставить количества absolute, прибавить delta.
+        """
+        raise NotImplementedError
+
+    async def prepare_checkout(self, user_id: int) -> dict[int, int] | None:
+        """
+        Вызывается в транзакции оформления заказа до блокировки корзины:
+        позиции должны оказаться в cart_items. Возвращает то, что нужно вернуть
+        в корзину, если оформление сорвется (или None).
+        """
+        return None
+
+    async def restore_checkout(self, user_id: int, lines: dict[int, int]) -> None:
+        pass
+
+
+class SqlCartStorage(CartStorage):
+    """
+    Корзины в PostgreSQL (carts / cart_items).
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_cart(self, user_id: int) -> Cart:
+        # Ищем корзину пользователя (вместе с товарами - одним запросом через JOIN)
+        cart = await self._load_cart(user_id)
+
+        if not cart:
+            await self._create_cart(user_id)
+            await self.db.commit()
+            cart = await self._load_cart(user_id)
+
+        return cart
+
+    async def _load_cart(self, user_id: int) -> Cart | None:
+        query = (
+            select(Cart)
+            .where(Cart.user_id == user_id)
+            .options(
+                joinedload(Cart.items).joinedload(CartItem.product)
+            )
+            # Позиции могли поменяться SQL-запросами в этой же сессии
+            .execution_options(populate_existing=True)
+        )
+        result = await self.db.execute(query)
+        return result.unique().scalar_one_or_none()
+
+    async def _create_cart(self, user_id: int) -> None:
+        # ON CONFLICT: параллельный запрос мог создать корзину раньше нас
+        await self.db.execute(
+            insert(Cart).values(user_id=user_id).on_conflict_do_nothing(index_elements=[Cart.user_id])
+        )
+
+    @staticmethod
+    def _cart_id(user_id: int):
+        return select(Cart.id).where(Cart.user_id == user_id).scalar_subquery()
+
+    async def get_summary(self, user_id: int) -> dict:
+        query = (
+            select(
+                func.coalesce(func.sum(CartItem.quantity), 0).label("item_count"),
+                func.count(CartItem.product_id.distinct()).label("distinct_products"),
+                func.coalesce(func.sum(CartItem.quantity * Product.price), 0).label("total_price"),
+            )
+            .select_from(CartItem)
+            .join(Product, Product.id == CartItem.product_id)
+            .where(CartItem.cart_id == self._cart_id(user_id))
+        )
+        result = await self.db.execute(query)
+        return dict(result.one()._mapping)
+
+    async def add_item(self, user_id: int, product_id: int, quantity: int) -> None:
+        # Один атомарный upsert: новая позиция или увеличение количества существующей.
+        # Уникальный ключ (cart_id, product_id) исключает дубли при параллельных добавлениях
+        stmt = insert(CartItem).from_select(
+            ["cart_id", "product_id", "quantity"],
+            select(Cart.id, literal(product_id), literal(quantity)).where(Cart.user_id == user_id),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CartItem.cart_id, CartItem.product_id],
+            set_={"quantity": CartItem.quantity + stmt.excluded.quantity},
+        ).returning(CartItem.id)
+
+        try:
+            added = (await self.db.execute(stmt)).scalar_one_or_none()
+            if added is None:
+                # Корзины еще нет (первое добавление) - создаем и повторяем
+                await self._create_cart(user_id)
+                await self.db.execute(stmt)
+            await self.db.commit()
+        except IntegrityError:
+            await self.db.rollback()
+            raise ValueError("Product not found")
+
+    async def update_item_quantity(self, user_id: int, product_id: int, quantity: int) -> None:
+        await self.db.execute(
+            update(CartItem)
+            .where(CartItem.cart_id == self._cart_id(user_id), CartItem.product_id == product_id)
+            .values(quantity=quantity)
+        )
+        await self.db.commit()
+
+    async def remove_item(self, user_id: int, product_id: int) -> None:
+        await self.db.execute(
+            delete(CartItem)
+            .where(CartItem.cart_id == self._cart_id(user_id), CartItem.product_id == product_id)
+        )
+        await self.db.commit()
+
+    async def clear_cart(self, user_id: int) -> None:
+        # Удаляем все элементы корзины одним запросом
+        await self.db.execute(delete(CartItem).where(CartItem.cart_id == self._cart_id(user_id)))
+        await self.db.commit()
+
+    async def apply_actions(self, user_id: int, removed: list[int], absolute: Lines, delta: Lines) -> None:
+        # Не более трех set-based запросов в одной транзакции
+        cart_id = self._cart_id(user_id)
+        try:
+            await self._create_cart(user_id)
+
+            if removed:
+                await self.db.execute(
+                    delete(CartItem).where(CartItem.cart_id == cart_id, CartItem.product_id.in_(removed))
+                )
+
+            if absolute:
+                stmt = insert(CartItem).values(
+                    [{"cart_id": cart_id, "product_id": pid, "quantity": q} for pid, q in absolute]
+                )
+                await self.db.execute(stmt.on_conflict_do_update(
+                    index_elements=[CartItem.cart_id, CartItem.product_id],
+                    set_={"quantity": stmt.excluded.quantity},
+                ))
+
+            if delta:
+                stmt = insert(CartItem).values(
+                    [{"cart_id": cart_id, "product_id": pid, "quantity": q} for pid, q in delta]
+                )
+                await self.db.execute(stmt.on_conflict_do_update(
+                    index_elements=[CartItem.cart_id, CartItem.product_id],
+                    set_={"quantity": CartItem.quantity + stmt.excluded.quantity},
+                ))
+
+            await self.db.commit()
+        except IntegrityError:
+            await self.db.rollback()
+            raise ValueError("Product not found")
+
+
+class KeyValueCartStorage(CartStorage):
+    """
+    Корзины в хранилище ключ-значение: один хеш product_id -> quantity на корзину.
+    Просмотр и правка корзины не пишут в PostgreSQL; позиции переносятся в cart_items
+    только при оформлении заказа. Карточки товаров берутся из кэша товаров.
+    """
+
+    def __init__(self, db: AsyncSession, backend: CacheBackend):
+        self.db = db
+        self.backend = backend
+        self.product_service = ProductService(db)
+
+    @staticmethod
+    def _key(owner: CartOwner) -> str:
+        return f"cart:user:{owner}" if isinstance(owner, int) else f"cart:{owner}"
+
+    async def _lines(self, owner: CartOwner) -> dict[int, int]:
+        return {int(pid): q for pid, q in (await self.backend.hgetall(self._key(owner))).items()}
+
+    async def _check_products(self, product_ids: list[int]) -> None:
+        # Внешнего ключа здесь нет, поэтому существование товаров проверяем сами (через кэш товаров)
+        if product_ids:
+            _, missing = await self.product_service.get_cached_products(product_ids)
+            if missing:
+                raise ValueError("Product not found")
+
+    async def get_cart(self, owner: CartOwner) -> dict:
+        lines = await self._lines(owner)
+        products, _ = await self.product_service.get_cached_products(sorted(lines))
+        return {
+            # У корзины в KV нет строки в carts: id - это user_id (0 для гостя), id позиции - product_id
+            "id": owner if isinstance(owner, int) else 0,
+            "items": [
+                {"id": cached.read.id, "quantity": lines[cached.read.id], "product": cached.read}
+                for cached in products
+            ],
+        }
+
+    async def get_summary(self, owner: CartOwner) -> dict:
+        lines = await self._lines(owner)
+        products, _ = await self.product_service.get_cached_products(list(lines))
+        return {
+            "item_count": sum(lines[cached.read.id] for cached in products),
+            "distinct_products": len(products),
+            "total_price": sum(cached.read.price * lines[cached.read.id] for cached in products),
+        }
+
+    async def add_item(self, owner: CartOwner, product_id: int, quantity: int) -> None:
+        await self._check_products([product_id])
+        await self.backend.hupdate(self._key(owner), incr_values={str(product_id): quantity}, ttl=settings.CART_TTL)
+
+    async def update_item_quantity(self, owner: CartOwner, product_id: int, quantity: int) -> None:
+        # Как и в SQL-хранилище, меняем только уже лежащую в корзине позицию
+        if product_id in await self._lines(owner):
+            await self.backend.hupdate(self._key(owner), set_values={str(product_id): quantity}, ttl=settings.CART_TTL)
+
+    async def remove_item(self, owner: CartOwner, product_id: int) -> None:
+        await self.backend.hupdate(self._key(owner), delete_fields=[str(product_id)])
+
+    async def clear_cart(self, owner: CartOwner) -> None:
+        await self.backend.delete(self._key(owner))
+
+    async def apply_actions(self, owner: CartOwner, removed: list[int], absolute: Lines, delta: Lines) -> None:
+        await self._check_products([pid for pid, _ in absolute + delta])
+        await self.backend.hupdate(
+            self._key(owner),
+            set_values={str(pid): q for pid, q in absolute},
+            incr_values={str(pid): q for pid, q in delta},
+            delete_fields=[str(pid) for pid in removed],
+            ttl=settings.CART_TTL,
+        )
+
+    async def take_lines(self, owner: CartOwner) -> dict[int, int]:
+        """
+        Забирает позиции корзины целиком (корзина при этом удаляется).
+        """
+        return {int(pid): q for pid, q in (await self.backend.htake(self._key(owner))).items()}
+
+    async def prepare_checkout(self, user_id: int) -> dict[int, int]:
+        # Позиции забираются из KV атомарно: параллельный checkout получит пустую корзину
+        lines = await self.take_lines(user_id)
+        try:
+            await self._stage_lines(user_id, lines)
+        except BaseException:
+            # Не удалось перенести в cart_items - возвращаем позиции в корзину
+            await self.put_back(user_id, lines)
+            raise
+        return lines
+
+    async def _stage_lines(self, user_id: int, lines: dict[int, int]) -> None:
+        await self.db.execute(
+            insert(Cart).values(user_id=user_id).on_conflict_do_nothing(index_elements=[Cart.user_id])
+        )
+        cart_id = await self.db.scalar(select(Cart.id).where(Cart.user_id == user_id).with_for_update())
+
+        # cart_items в KV-режиме - только промежуточный буфер оформления заказа
+        await self.db.execute(delete(CartItem).where(CartItem.cart_id == cart_id))
+        if lines:
+            # JOIN с products отбрасывает товары, удаленные из каталога
+            values = func.unnest(
+                literal(list(lines), ARRAY(Integer)), literal(list(lines.values()), ARRAY(Integer))
+            ).table_valued("product_id", "quantity").render_derived()
+            await self.db.execute(
+                insert(CartItem).from_select(
+                    ["cart_id", "product_id", "quantity"],
+                    select(literal(cart_id), Product.id, values.c.quantity)
+                    .join(values, values.c.product_id == Product.id),
+                )
+            )
+
+    async def restore_checkout(self, user_id: int, lines: dict[int, int]) -> None:
+        await self.put_back(user_id, lines)
+
+    async def put_back(self, owner: CartOwner, lines: dict[int, int]) -> None:
+        """
+        Возвращает забранные позиции, складывая с тем, что успели добавить за это время.
+        """
+        if lines:
+            await self.backend.hupdate(
+                self._key(owner),
+                incr_values={str(pid): q for pid, q in lines.items()},
+                ttl=settings.CART_TTL,
+            )
+
+
+def get_cart_storage(db: AsyncSession) -> CartStorage:
+    """
+    Фабрика: CART_STORAGE=kv - корзины в KV-хранилище (память процесса или Redis), иначе в PostgreSQL.
+    """
+    if settings.CART_STORAGE == "kv":
+        return KeyValueCartStorage(db, cache_backend)
+    return SqlCartStorage(db)
@@ -1,9 +1,68 @@
+import time
+from typing import List, Optional
+
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, insert, delete, literal, union_all, func
+from sqlalchemy.orm import aliased
 from sqlalchemy.orm.attributes import set_committed_value  # <--- ВАЖНЫЙ ИМПОРТ
 
-from app.models.models import Category
-from app.schemas.category import CategoryCreate
+from app.core.cache import CacheBackend, CacheStats, cache_backend
+from app.core.metrics import register_metrics
+from app.models.models import Category, CategoryClosure
+from app.schemas.category import CategoryCreate, CategoryRead
+
+
+class CategoryTreeCache:
+    """
+    Кэш готового JSON дерева категорий.
+    Локальная копия в памяти процесса помечена версией; сама версия (и копия JSON)
+    лежат в общем хранилище, поэтому инвалидация в одном воркере видна всем остальным.
+    """
+    VERSION_KEY = "categories:tree:version"
+    PAYLOAD_TTL = 24 * 60 * 60
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.stats = CacheStats()
+        self._version: Optional[int] = None
+        self._payload: Optional[bytes] = None
+
+    def _payload_key(self, version: int) -> str:
+        return f"categories:tree:{version}"
+
+    async def current_version(self) -> int:
+        return int(await self.backend.get(self.VERSION_KEY) or 0)
+
+    async def get(self, version: int) -> Optional[bytes]:
+        if self._payload is not None and self._version == version:
+            self.stats.hits += 1
+            return self._payload
+
+        # Другой воркер мог уже собрать эту версию
+        payload = await self.backend.get(self._payload_key(version))
+        if payload is not None:
+            self.stats.hits += 1
+            self._version, self._payload = version, payload
+            return payload
+
+        self.stats.misses += 1
+        return None
+
+    async def put(self, version: int, payload: bytes, rebuild_seconds: float) -> None:
+        self.stats.record_rebuild(rebuild_seconds)
+        self._version, self._payload = version, payload
+        await self.backend.set(self._payload_key(version), payload, ttl=self.PAYLOAD_TTL)
+
+    async def invalidate(self) -> None:
+        self._version, self._payload = None, None
+        await self.backend.incr(self.VERSION_KEY)
+
+
+category_tree_cache = CategoryTreeCache(cache_backend)
+register_metrics("category_tree_cache", category_tree_cache.stats.as_dict)
+
+_tree_adapter = TypeAdapter(List[CategoryRead])
 
 
 class CategoryService:
@@ -13,8 +72,24 @@ class CategoryService:
     async def create_category(self, schema: CategoryCreate) -> Category:
         category = Category(**schema.model_dump())
         self.db.add(category)
+        # flush, чтобы получить id до записи в таблицу замыкания (все в одной транзакции)
+        await self.db.flush()
+
+        # Новая категория наследует всех предков родителя (depth + 1) и ссылается сама на себя
+        ancestors = (
+            select(CategoryClosure.ancestor_id, literal(category.id), CategoryClosure.depth + 1)
+            .where(CategoryClosure.descendant_id == category.parent_id)
+        )
+        itself = select(literal(category.id), literal(category.id), literal(0))
+        await self.db.execute(
+            insert(CategoryClosure).from_select(
+                ["ancestor_id", "descendant_id", "depth"], union_all(ancestors, itself)
+            )
+        )
+
         await self.db.commit()
         await self.db.refresh(category)
+        await category_tree_cache.invalidate()
 
         # ВМЕСТО category.children = []
         # Мы жестко устанавливаем значение, минуя попытку загрузки из БД
@@ -48,8 +123,59 @@ class CategoryService:
 
         return roots
 
+    async def get_category_tree_json(self) -> bytes:
+        """
+        Дерево категорий, сразу сериализованное в JSON, из кэша.
+        При промахе дерево собирается из БД и кладется в кэш под прочитанной до сборки версией:
+        если за время сборки дерево инвалидировали, следующий запрос просто соберет его заново.
+        """
+        version = await category_tree_cache.current_version()
+        payload = await category_tree_cache.get(version)
+        if payload is None:
+            started = time.perf_counter()
+            roots = await self.get_all_categories()
+            payload = _tree_adapter.dump_json(roots)
+            await category_tree_cache.put(version, payload, time.perf_counter() - started)
+        return payload
+
     async def get_category_by_id(self, category_id: int) -> Category | None:
         category = await self.db.get(Category, category_id)
         if category:
             set_committed_value(category, "children", [])
-        return category
\ No newline at end of file
+        return category
+
+    async def ensure_closure(self) -> None:
+        """
+        Пересобирает таблицу замыкания, если она не соответствует категориям
+        (например, категории были созданы до ее появления).
+        """
+        categories_count = await self.db.scalar(select(func.count()).select_from(Category))
+        self_links_count = await self.db.scalar(
+            select(func.count()).select_from(CategoryClosure).where(CategoryClosure.depth == 0)
+        )
+        if categories_count != self_links_count:
+            await self.rebuild_closure()
+
+    async def rebuild_closure(self) -> None:
+        """
+        Полная пересборка таблицы замыкания рекурсивным CTE.
+        """
+        tree = select(
+            Category.id.label("ancestor_id"),
+            Category.id.label("descendant_id"),
+            literal(0).label("depth"),
+        ).cte("tree", recursive=True)
+        child = aliased(Category)
+        tree = tree.union_all(
+            select(tree.c.ancestor_id, child.id, tree.c.depth + 1)
+            .join(child, child.parent_id == tree.c.descendant_id)
+        )
+
+        await self.db.execute(delete(CategoryClosure))
+        await self.db.execute(
+            insert(CategoryClosure).from_select(
+                ["ancestor_id", "descendant_id", "depth"],
+                select(tree.c.ancestor_id, tree.c.descendant_id, tree.c.depth),
+            )
+        )
+        await self.db.commit()
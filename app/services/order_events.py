@@ -0,0 +1,23 @@
+"""
+События заказов для outbox и их обработчики.
+Обработчики выполняются фоновым OutboxWorker после коммита заказа и не влияют на время checkout.
+"""
+from app.db.session import AsyncSessionLocal
+from app.services.outbox_service import outbox_handler
+from app.services.sales_rollup_service import SalesRollupService
+
+ORDER_CREATED = "order.created"
+
+
+@outbox_handler(ORDER_CREATED)
+async def log_order_created(payload: dict) -> None:
+    # Точка подключения уведомлений, синхронизации с CRM, складских остатков и т.п.
+    print(f"Order {payload['order_id']} created: user={payload['user_id']} total={payload['total_price']}")
+
+
+@outbox_handler(ORDER_CREATED)
+async def update_sales_rollups(payload: dict) -> None:
+    # Идемпотентно: повторная доставка события заказ второй раз не учтет
+    async with AsyncSessionLocal() as session:
+        await SalesRollupService(session).record_order(payload["order_id"])
+        await session.commit()
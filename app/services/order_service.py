@@ -1,59 +1,179 @@
+import datetime
+
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload  # <--- Нужно добавить
+from sqlalchemy import select, insert, delete, func, literal, true, String, desc, tuple_
+from sqlalchemy.orm import joinedload, selectinload
+
+from app.core.pagination import encode_cursor, decode_cursor
 
-from app.models.models import Order, OrderItem
+from app.models.models import Cart, CartItem, Order, OrderItem, Product
 from app.services.cart_service import CartService
+from app.services.outbox_service import OutboxService, outbox_worker
+from app.services.order_events import ORDER_CREATED
 
 
 class OrderService:
     def __init__(self, db: AsyncSession):
         self.db = db
         self.cart_service = CartService(db)
+        self.outbox = OutboxService(db)
 
-    async def create_order(self, user_id: int) -> Order:
-        # 1. Получаем корзину
-        cart = await self.cart_service.get_or_create_cart(user_id)
+    async def create_order(self, user_id: int, idempotency_key: str | None = None) -> Order:
+        """
+        Оформление заказа несколькими set-based запросами: число запросов
+        не зависит от количества позиций в корзине.
+        С idempotency_key повторный вызов возвращает уже созданный заказ, не трогая корзину.
+        """
+        # 0. Быстрый путь для повтора: один поиск по уникальному индексу (user_id, idempotency_key)
+        if idempotency_key:
+            existing = await self._get_order_by_key(user_id, idempotency_key)
+            if existing:
+                return existing
 
-        if not cart.items:
-            raise ValueError("Cart is empty")
+        # Позиции из хранилища корзин (в KV-режиме) переносятся в cart_items в этой же транзакции;
+        # если заказ не оформится, возвращаем их обратно в корзину
+        lines = None
+        try:
+            lines = await self.cart_service.prepare_checkout(user_id)
+            order_id = await self._checkout(user_id, idempotency_key)
+        except BaseException:
+            await self.cart_service.restore_checkout(user_id, lines)
+            raise
+        if not isinstance(order_id, int):
+            # Дубль по idempotency_key: заказ уже создан параллельным запросом
+            await self.cart_service.restore_checkout(user_id, lines)
+            return order_id
 
-        # 2. Считаем сумму и создаем объекты OrderItem
-        total_price = 0.0
-        order_items = []
-
-        for item in cart.items:
-            price = item.product.price
-            total_price += price * item.quantity
-
-            order_items.append(OrderItem(
-                product_id=item.product_id,
-                quantity=item.quantity,
-                price_at_purchase=price  # Фиксируем цену!
-            ))
-
-        # 3. Создаем заказ
-        order = Order(
-            user_id=user_id,
-            total_price=total_price,
-            items=order_items
+        return await self._get_order(Order.id == order_id)
+
+    async def _checkout(self, user_id: int, idempotency_key: str | None) -> int | Order:
+        # 1. Блокируем корзину: параллельный checkout той же корзины дождется нас
+        # и увидит ее уже пустой
+        cart_id = await self.db.scalar(
+            select(Cart.id).where(Cart.user_id == user_id).with_for_update()
         )
-        self.db.add(order)
 
-        # 4. Очищаем корзину (удаляем CartItems)
-        for item in cart.items:
-            await self.db.delete(item)
+        # Параллельный дубль ждал блокировку выше; первый запрос уже закоммитил заказ - отдаем его
+        if idempotency_key:
+            existing_id = await self.db.scalar(
+                select(Order.id).where(Order.user_id == user_id, Order.idempotency_key == idempotency_key)
+            )
+            if existing_id:
+                # rollback expire'ит загруженные объекты - заказ читаем уже после него
+                await self.db.rollback()
+                return await self._get_order(Order.id == existing_id)
+
+        if cart_id is None:
+            raise ValueError("Cart is empty")
+
+        # Цены читаются один раз: CTE одного запроса видят один снимок данных,
+        # поэтому сумма заказа и снепшот цен позиций не разойдутся при параллельной смене цены
+        cart_lines = (
+            select(CartItem.product_id, CartItem.quantity, Product.price)
+            .join(Product, Product.id == CartItem.product_id)
+            .where(CartItem.cart_id == cart_id)
+        ).cte("cart_lines")
+
+        # 2. Заказ, сумму считает БД. HAVING отсекает пустую корзину
+        new_order = (
+            insert(Order)
+            .from_select(
+                ["user_id", "status", "idempotency_key", "total_price"],
+                select(
+                    literal(user_id),
+                    literal("pending"),
+                    literal(idempotency_key, String),
+                    func.sum(cart_lines.c.price * cart_lines.c.quantity),
+                ).having(func.count() > 0),
+            )
+            .returning(Order.id, Order.total_price)
+        ).cte("new_order")
+
+        # 3. Позиции с фиксацией цены (Snapshot) - в том же запросе
+        new_items = insert(OrderItem).from_select(
+            ["order_id", "product_id", "quantity", "price_at_purchase"],
+            select(new_order.c.id, cart_lines.c.product_id, cart_lines.c.quantity, cart_lines.c.price)
+            .select_from(new_order)
+            .join(cart_lines, true()),
+        ).cte("new_items")
+
+        created = (await self.db.execute(
+            select(new_order.c.id, new_order.c.total_price).add_cte(new_items)
+        )).first()
+        if created is None:
+            await self.db.rollback()
+            raise ValueError("Cart is empty")
+        order_id = created.id
+
+        # 4. Очищаем корзину одним DELETE
+        await self.db.execute(delete(CartItem).where(CartItem.cart_id == cart_id))
 
-        # 5. Коммит
+        # 5. Событие для фоновых обработчиков (агрегаты продаж, уведомления, интеграции) - в той же транзакции
+        await self.outbox.add_event(
+            ORDER_CREATED, {"order_id": order_id, "user_id": user_id, "total_price": created.total_price}
+        )
+
+        # 6. Коммит (снимает блокировку корзины)
         await self.db.commit()
+        outbox_worker.notify()
+
+        return order_id
+
+    async def get_user_orders(
+            self, user_id: int, limit: int, cursor: str | None = None, summary: bool = False
+    ) -> dict:
+        """
+        История заказов пользователя, новые сверху, keyset-пагинация по (created_at, id).
+        summary=True отдает краткие строки с количеством товаров, не загружая OrderItem.
+        """
+        if summary:
+            item_count = (
+                select(func.coalesce(func.sum(OrderItem.quantity), 0))
+                .where(OrderItem.order_id == Order.id)
+                .scalar_subquery()
+            )
+            query = select(Order.id, Order.created_at, Order.status, Order.total_price, item_count.label("item_count"))
+        else:
+            query = select(Order).options(selectinload(Order.items))
+
+        query = query.where(Order.user_id == user_id).order_by(desc(Order.created_at), desc(Order.id))
+        if cursor:
+            query = query.where(self._seek_condition(cursor))
+        # На одну запись больше, чтобы понять, есть ли следующая страница
+        query = query.limit(limit + 1)
+
+        result = await self.db.execute(query)
+        rows = result.all() if summary else result.scalars().all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor({"k": [last.created_at.isoformat(), last.id]})
+
+        return {"items": rows, "next_cursor": next_cursor}
+
+    @staticmethod
+    def _seek_condition(cursor: str):
+        payload = decode_cursor(cursor)
+        try:
+            created_at, order_id = payload["k"]
+            key = (datetime.datetime.fromisoformat(created_at), int(order_id))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+        return tuple_(Order.created_at, Order.id) < tuple_(*key)
+
+    async def _get_order_by_key(self, user_id: int, idempotency_key: str) -> Order | None:
+        return await self._get_order(Order.user_id == user_id, Order.idempotency_key == idempotency_key)
 
-        # 6. ВАЖНО: Вместо refresh делаем явный запрос с подгрузкой items.
+    async def _get_order(self, *criteria) -> Order | None:
+        # ВАЖНО: Вместо refresh делаем явный запрос с подгрузкой items.
         # Это предотвращает ошибку MissingGreenlet при сериализации ответа.
         query = (
             select(Order)
-            .where(Order.id == order.id)
-            .options(selectinload(Order.items))
+            .where(*criteria)
+            .options(joinedload(Order.items))
         )
 
         result = await self.db.execute(query)
-        return result.scalar_one()
\ No newline at end of file
+        return result.unique().scalar_one_or_none()
@@ -0,0 +1,207 @@
+import asyncio
+import datetime
+import random
+import time
+from typing import Awaitable, Callable
+
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.metrics import register_metrics
+from app.db.session import AsyncSessionLocal
+from app.models.models import OutboxEvent
+
+# Обработчик получает payload события. Доставка "хотя бы один раз":
+# при сбое или истечении аренды событие обработается повторно, обработчики должны быть идемпотентны
+OutboxHandler = Callable[[dict], Awaitable[None]]
+
+_handlers: dict[str, list[OutboxHandler]] = {}
+
+
+def outbox_handler(event_type: str):
+    """
+    Регистрирует обработчик события:
+
+        @outbox_handler("order.created")
+        async def notify_customer(payload: dict) -> None: ...
+    """
+    def decorator(handler: OutboxHandler) -> OutboxHandler:
+        _handlers.setdefault(event_type, []).append(handler)
+        return handler
+    return decorator
+
+
+class OutboxService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def add_event(self, event_type: str, payload: dict) -> None:
+        """
+        Добавляет событие в текущую транзакцию (коммит - за вызывающим).
+        """
+        self.db.add(OutboxEvent(event_type=event_type, payload=payload))
+        await self.db.flush()
+
+
+class OutboxWorker:
+    """
+    Фоновая задача (asyncio), разбирающая outbox пачками.
+    Пачка арендуется UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED) и сразу коммитится,
+    поэтому несколько воркеров (процессов) не берут одни и те же события, а обработчики
+    выполняются вне транзакции. Ошибка обработчика - повтор с экспоненциальной паузой,
+    после OUTBOX_MAX_ATTEMPTS попыток событие помечается failed.
+    """
+    # Как часто удалять обработанные события старше суток
+    PURGE_INTERVAL = 60 * 60
+    RETENTION = datetime.timedelta(days=1)
+
+    def __init__(self, session_factory: async_sessionmaker = AsyncSessionLocal):
+        self.session_factory = session_factory
+        self._task: asyncio.Task | None = None
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._last_purge = 0.0
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # Даем дообработать текущую пачку
+        self._stopping = True
+        self._wakeup.set()
+        if self._task:
+            await self._task
+            self._task = None
+
+    def notify(self) -> None:
+        """
+        Будит воркер сразу после коммита нового события, не дожидаясь очередного опроса.
+        """
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                claimed = await self.process_batch()
+                if claimed < settings.OUTBOX_BATCH_SIZE:
+                    await self._purge()
+            except Exception as e:
+                print(f"Outbox worker error: {e}")
+                claimed = 0
+
+            # Полная пачка - сразу за следующей, иначе ждем нового события или таймаута опроса
+            if claimed < settings.OUTBOX_BATCH_SIZE and not self._stopping:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.OUTBOX_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def process_batch(self) -> int:
+        """
+        Арендует и обрабатывает одну пачку. Возвращает число взятых событий.
+        """
+        async with self.session_factory() as session:
+            events = await self._claim(session)
+            if not events:
+                return 0
+
+            done: list[int] = []
+            for event in events:
+                try:
+                    await self._dispatch(event.event_type, event.payload)
+                except Exception as e:
+                    await self._fail(session, event.id, event.attempts, f"{type(e).__name__}: {e}")
+                else:
+                    done.append(event.id)
+
+            if done:
+                await session.execute(
+                    update(OutboxEvent)
+                    .where(OutboxEvent.id.in_(done))
+                    .values(status="done", processed_at=func.now(), last_error=None)
+                    .execution_options(synchronize_session=False)
+                )
+                self.processed += len(done)
+            await session.commit()
+            return len(events)
+
+    async def _claim(self, session: AsyncSession) -> list:
+        due = (
+            select(OutboxEvent.id)
+            .where(OutboxEvent.status == "pending", OutboxEvent.available_at <= func.now())
+            .order_by(OutboxEvent.available_at, OutboxEvent.id)
+            .limit(settings.OUTBOX_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+        result = await session.execute(
+            update(OutboxEvent)
+            .where(OutboxEvent.id.in_(due))
+            .values(
+                attempts=OutboxEvent.attempts + 1,
+                available_at=func.now() + datetime.timedelta(seconds=settings.OUTBOX_LEASE),
+            )
+            .returning(OutboxEvent.id, OutboxEvent.event_type, OutboxEvent.payload, OutboxEvent.attempts)
+            .execution_options(synchronize_session=False)
+        )
+        events = sorted(result.all(), key=lambda event: event.id)
+        # Аренда фиксируется сразу: обработчики работают без открытой транзакции
+        await session.commit()
+        return events
+
+    @staticmethod
+    async def _dispatch(event_type: str, payload: dict) -> None:
+        handlers = _handlers.get(event_type)
+        if not handlers:
+            raise LookupError(f"No handler registered for {event_type}")
+        for handler in handlers:
+            await handler(payload)
+
+    async def _fail(self, session: AsyncSession, event_id: int, attempts: int, error: str) -> None:
+        if attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            values = {"status": "failed", "last_error": error}
+            self.failed += 1
+            print(f"Outbox event {event_id} failed after {attempts} attempts: {error}")
+        else:
+            # Экспоненциальная пауза с разбросом, чтобы повторы не шли волной
+            delay = min(settings.OUTBOX_RETRY_BASE * 2 ** (attempts - 1), settings.OUTBOX_RETRY_MAX)
+            delay *= random.uniform(0.5, 1.0)
+            values = {"available_at": func.now() + datetime.timedelta(seconds=delay), "last_error": error}
+            self.retried += 1
+
+        await session.execute(
+            update(OutboxEvent)
+            .where(OutboxEvent.id == event_id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+    async def _purge(self) -> None:
+        if time.monotonic() - self._last_purge < self.PURGE_INTERVAL:
+            return
+        self._last_purge = time.monotonic()
+        async with self.session_factory() as session:
+            await session.execute(
+                delete(OutboxEvent).where(
+                    OutboxEvent.status == "done",
+                    OutboxEvent.processed_at < func.now() - self.RETENTION,
+                )
+            )
+            await session.commit()
+
+    def stats_dict(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+outbox_worker = OutboxWorker()
+register_metrics("outbox", outbox_worker.stats_dict)
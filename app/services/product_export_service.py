@@ -0,0 +1,51 @@
+import csv
+import io
+import json
+from typing import AsyncIterator
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.schemas.product import CatalogFormat, ProductFilter, ProductRead
+from app.services.product_service import ProductService
+
+# Колонки CSV совпадают с импортом (плюс id), так что выгрузку можно загрузить обратно
+CSV_COLUMNS = ["id", "sku", "name", "price", "category_id", "description", "specs", "image_url"]
+
+
+class ProductExportService:
+    """
+    Выгрузка каталога в NDJSON / CSV кусками текста для StreamingResponse.
+    """
+    # Сколько текста копим перед отправкой клиенту
+    FLUSH_SIZE = 64 * 1024
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.product_service = ProductService(db)
+
+    async def export(self, filters: ProductFilter | None, fmt: CatalogFormat) -> AsyncIterator[str]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == CatalogFormat.CSV else None
+        if writer:
+            writer.writerow(CSV_COLUMNS)
+        # Первая порция уходит клиенту сразу после первой строки из БД, дальше - кусками по FLUSH_SIZE
+        flush_at = 0
+
+        async for product in self.product_service.stream_products(filters):
+            if writer:
+                writer.writerow([
+                    product.id, product.sku, product.name, product.price, product.category_id,
+                    product.description, json.dumps(product.specs or {}, ensure_ascii=False), product.image_url,
+                ])
+            else:
+                buffer.write(ProductRead.model_validate(product).model_dump_json())
+                buffer.write("\n")
+
+            if buffer.tell() >= flush_at:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                flush_at = self.FLUSH_SIZE
+
+        if buffer.tell():
+            yield buffer.getvalue()
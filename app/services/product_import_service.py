@@ -0,0 +1,185 @@
+import asyncio
+import codecs
+import csv
+import json
+from itertools import islice
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.models import Category, Product
+from app.schemas.product import CatalogFormat, ProductImportRow
+from app.services.product_service import product_cache
+
+
+def detect_import_format(filename: Optional[str]) -> Optional[CatalogFormat]:
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return CatalogFormat.CSV
+    if name.endswith((".ndjson", ".jsonl")):
+        return CatalogFormat.NDJSON
+    return None
+
+
+class _Utf8Lines:
+    """
+    Построчно декодирует байты из UTF-8. Строку с битой кодировкой не роняет импорт:
+    она декодируется с заменой символов, а флаг invalid помечает текущую запись как ошибочную.
+    """
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.invalid = False
+
+    def __iter__(self) -> Iterator[str]:
+        for line_no, line in enumerate(self.stream):
+            if line_no == 0 and line.startswith(codecs.BOM_UTF8):
+                line = line[len(codecs.BOM_UTF8):]
+            try:
+                yield line.decode("utf-8")
+            except UnicodeDecodeError:
+                self.invalid = True
+                yield line.decode("utf-8", errors="replace")
+
+    def take_invalid(self) -> bool:
+        invalid, self.invalid = self.invalid, False
+        return invalid
+
+
+def iter_records(stream: BinaryIO, fmt: CatalogFormat) -> Iterator[tuple[int, dict | str]]:
+    """
+    Построчно читает CSV/NDJSON (UTF-8, BOM допускается) и отдает
+    (номер записи, словарь полей или текст ошибки разбора). Файл целиком в память не загружается.
+    """
+    lines = _Utf8Lines(stream)
+
+    if fmt == CatalogFormat.CSV:
+        reader = csv.DictReader(lines)
+        for row_no, record in enumerate(reader, start=1):
+            # Строки записи читаются ровно перед ее выдачей, поэтому флаг относится к ней
+            yield row_no, "Invalid UTF-8 encoding" if lines.take_invalid() else record
+        return
+
+    row_no = 0
+    for line in lines:
+        invalid = lines.take_invalid()
+        if not line.strip():
+            continue
+        row_no += 1
+        if invalid:
+            yield row_no, "Invalid UTF-8 encoding"
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield row_no, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield row_no, "Invalid JSON: expected an object"
+            continue
+        yield row_no, record
+
+
+def _format_validation_error(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc']) or 'row'}: {err['msg']}" for err in e.errors()
+    )
+
+
+class ProductImportService:
+    """
+    Массовый импорт товаров: валидация пачками через ProductImportRow
+    и многострочный INSERT ... ON CONFLICT (sku) DO UPDATE на каждую пачку.
+    """
+    BATCH_SIZE = 1000
+    # Ошибок строк в отчете не больше этого: отчет по битому файлу не должен расти вместе с файлом
+    MAX_REPORTED_ERRORS = 100
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def import_records(self, records: Iterable[tuple[int, dict | str]]) -> dict:
+        report = {"total_rows": 0, "upserted": 0, "failed": 0, "errors_truncated": False, "batches": []}
+        reported_errors = 0
+        records = iter(records)
+
+        batch_no = 0
+        while True:
+            # Чтение и разбор файла - блокирующие, выполняем их в потоке, а не в event loop
+            chunk = await asyncio.to_thread(lambda: list(islice(records, self.BATCH_SIZE)))
+            if not chunk:
+                break
+            batch_no += 1
+
+            batch_report = await self._import_batch(batch_no, chunk)
+            errors = batch_report["errors"]
+            batch_report["failed"] = len(errors)
+            batch_report["errors"] = errors[:self.MAX_REPORTED_ERRORS - reported_errors]
+            reported_errors += len(batch_report["errors"])
+            if len(batch_report["errors"]) < len(errors):
+                report["errors_truncated"] = True
+
+            report["batches"].append(batch_report)
+            report["total_rows"] += batch_report["rows"]
+            report["upserted"] += batch_report["upserted"]
+            report["failed"] += batch_report["failed"]
+
+        return report
+
+    async def _import_batch(self, batch_no: int, chunk: list[tuple[int, dict | str]]) -> dict:
+        errors = []
+        # sku -> (номер строки, данные). Повтор артикула внутри пачки: побеждает последняя строка,
+        # иначе ON CONFLICT не сможет обновить одну и ту же запись дважды
+        rows: dict[str, tuple[int, dict]] = {}
+
+        for row_no, record in chunk:
+            if isinstance(record, str):
+                errors.append({"row": row_no, "error": record})
+                continue
+            try:
+                row = ProductImportRow.model_validate(record)
+            except ValidationError as e:
+                errors.append({"row": row_no, "error": _format_validation_error(e)})
+                continue
+            rows[row.sku] = (row_no, row.model_dump())
+
+        # Несуществующие категории отсекаем заранее одним запросом, чтобы FK не уронил всю пачку
+        category_ids = {data["category_id"] for _, data in rows.values()}
+        if category_ids:
+            result = await self.db.execute(select(Category.id).where(Category.id.in_(category_ids)))
+            known = set(result.scalars().all())
+            for sku, (row_no, data) in list(rows.items()):
+                if data["category_id"] not in known:
+                    errors.append({"row": row_no, "error": f"category_id: category {data['category_id']} not found"})
+                    del rows[sku]
+
+        upserted = 0
+        if rows:
+            values = [data for _, data in rows.values()]
+            stmt = insert(Product).values(values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Product.sku],
+                set_={
+                    "name": stmt.excluded.name,
+                    "price": stmt.excluded.price,
+                    "specs": stmt.excluded.specs,
+                    "category_id": stmt.excluded.category_id,
+                    # Пустые в файле описание и картинку не затираем
+                    "description": func.coalesce(stmt.excluded.description, Product.description),
+                    "image_url": func.coalesce(stmt.excluded.image_url, Product.image_url),
+                },
+            ).returning(Product.id)
+
+            result = await self.db.execute(stmt)
+            ids = result.scalars().all()
+            await self.db.commit()
+
+            for product_id in ids:
+                product_cache.delete(product_id)
+            upserted = len(ids)
+
+        errors.sort(key=lambda e: e["row"])
+        return {"batch": batch_no, "rows": len(chunk), "upserted": upserted, "errors": errors}
@@ -1,9 +1,32 @@
+import hashlib
+import json
+from typing import AsyncIterator, NamedTuple
+
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, asc
-from app.models.models import Product
-from app.schemas.product import ProductCreate, ProductFilter, ProductUpdate
+from sqlalchemy import select, desc, asc, tuple_, or_, cast, func, Float, Integer, String, case, literal, null, true, union_all, column, any_
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, JSONPATH, REGCONFIG
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.metrics import register_metrics
+from app.core.pagination import encode_cursor, decode_cursor
+from app.models.models import Product, CategoryClosure, FTS_CONFIG
+from app.schemas.product import ProductCreate, ProductFilter, ProductUpdate, SortOption, SpecRange, ProductRead
+
+
+class CachedProduct(NamedTuple):
+    read: ProductRead
+    payload: bytes  # готовый JSON ответа
+    etag: str  # сильный ETag: хеш от payload
+
+
+# Карточки товаров: read-through кэш перед get_product_by_id
+product_cache = LRUCache(maxsize=settings.PRODUCT_CACHE_SIZE, ttl=settings.PRODUCT_CACHE_TTL)
+register_metrics("product_cache", product_cache.stats_dict)
+
 
 class ProductService:
+    EXPORT_CHUNK = 1000
+
     def __init__(self, db: AsyncSession):
         self.db = db
 
@@ -27,15 +50,266 @@ class ProductService:
     async def get_product_by_id(self, product_id: int) -> Product | None:
         return await self.db.get(Product, product_id)
 
-    async def get_filtered_products(self, filters: ProductFilter) -> list[Product]:
+    async def get_cached_product(self, product_id: int) -> CachedProduct | None:
+        """
+        Карточка товара из кэша; при промахе читается из БД и сериализуется один раз.
+        """
+        cached = product_cache.get(product_id)
+        if cached is None:
+            product = await self.get_product_by_id(product_id)
+            if not product:
+                return None
+            cached = self._cache_product(product)
+        return cached
+
+    async def get_cached_products(self, ids: list[int]) -> tuple[list[CachedProduct], list[int]]:
+        """
+        Несколько карточек за раз: теплые id берутся из кэша, остальные - одним запросом
+        WHERE id = ANY(:ids). Возвращает карточки в порядке запроса и список ненайденных id.
+        """
+        ids = list(dict.fromkeys(ids))
+        found: dict[int, CachedProduct] = {}
+        cold = []
+        for product_id in ids:
+            cached = product_cache.get(product_id)
+            if cached is None:
+                cold.append(product_id)
+            else:
+                found[product_id] = cached
+
+        if cold:
+            result = await self.db.execute(
+                select(Product).where(Product.id == any_(literal(cold, ARRAY(Integer))))
+            )
+            for product in result.scalars().all():
+                found[product.id] = self._cache_product(product)
+
+        items = [found[product_id] for product_id in ids if product_id in found]
+        missing = [product_id for product_id in ids if product_id not in found]
+        return items, missing
+
+    @staticmethod
+    def _cache_product(product: Product) -> CachedProduct:
+        read = ProductRead.model_validate(product)
+        payload = read.model_dump_json().encode()
+        etag = '"' + hashlib.sha256(payload).hexdigest()[:32] + '"'
+        cached = CachedProduct(read, payload, etag)
+        product_cache.set(product.id, cached)
+        return cached
+
+    async def get_filtered_products(self, filters: ProductFilter) -> dict:
         """
         Сложная фильтрация товаров.
+        Возвращает страницу и курсор следующей страницы (keyset-пагинация).
         """
-        query = select(Product)
+        sort_by = self._resolve_sort(filters)
+
+        # При сортировке по релевантности ранг считается в том же запросе,
+        # чтобы положить его в курсор
+        rank = self._rank_expression(filters.q) if sort_by == SortOption.RELEVANCE else None
+        query = select(Product) if rank is None else select(Product, rank)
+        query = self._apply_filters(query, filters)
+
+        # Сортировка. id всегда идет вторым ключом, чтобы порядок был строгим
+        # и совпадал с составными индексами (price, id)
+        if sort_by == SortOption.PRICE_ASC:
+            query = query.order_by(asc(Product.price), asc(Product.id))
+        elif sort_by == SortOption.PRICE_DESC:
+            query = query.order_by(desc(Product.price), desc(Product.id))
+        elif sort_by == SortOption.RELEVANCE:
+            query = query.order_by(desc(rank), desc(Product.id))
+        else:
+            query = query.order_by(desc(Product.id))  # Newest
+
+        # Пагинация: по курсору (seek) или по номеру страницы (OFFSET)
+        if filters.cursor:
+            query = query.filter(self._seek_condition(sort_by, filters.cursor, rank))
+        else:
+            query = query.offset((filters.page - 1) * filters.limit)
+
+        # Берем на одну запись больше, чтобы понять, есть ли следующая страница
+        query = query.limit(filters.limit + 1)
+
+        result = await self.db.execute(query)
+        rows = result.all()
+
+        next_cursor = None
+        if len(rows) > filters.limit:
+            rows = rows[:filters.limit]
+            next_cursor = self._make_cursor(sort_by, rows[-1])
+
+        page = {"items": [row[0] for row in rows], "next_cursor": next_cursor}
+        if filters.facets:
+            page["facets"] = await self.get_facets(filters)
+        return page
+
+    async def get_facets(self, filters: ProductFilter) -> dict:
+        """
+        Фасеты для сайдбара фильтров одним SQL-запросом:
+        счетчики по значениям specs, по категориям и гистограмма цен
+        по товарам, подходящим под текущий фильтр (без учета пагинации).
+        """
+        filtered = self._apply_filters(
+            select(Product.id, Product.category_id, Product.price, Product.specs), filters
+        ).cte("filtered")
+        bounds = select(
+            func.min(filtered.c.price).label("lo"),
+            func.max(filtered.c.price).label("hi"),
+        ).cte("bounds")
+        buckets = filters.price_buckets
+
+        # Все три агрегации сводятся к строкам (facet, key, value, count) и склеиваются UNION ALL
+        kv = (
+            func.jsonb_each(filtered.c.specs)
+            .table_valued(column("key", String), column("value", JSONB))
+            .lateral("kv")
+        )
+        specs_q = (
+            select(
+                literal("spec").label("facet"),
+                kv.c.key.label("key"),
+                kv.c.value.label("value"),
+                func.count().label("count"),
+            )
+            .select_from(filtered)
+            .join(kv, true())
+            # Вложенные объекты и массивы фасетами не считаем
+            .where(func.jsonb_typeof(kv.c.value).in_(["string", "number", "boolean"]))
+            .group_by(kv.c.key, kv.c.value)
+        )
+
+        categories_q = (
+            select(
+                literal("category"),
+                cast(null(), String),
+                func.to_jsonb(filtered.c.category_id, type_=JSONB),
+                func.count(),
+            )
+            .select_from(filtered)
+            .group_by(filtered.c.category_id)
+        )
 
-        # 1. Фильтр по категории
+        # width_bucket кладет максимум в корзину n+1, поэтому ограничиваем сверху через least.
+        # Если все цены равны, считаем все товары одной корзиной
+        bucketed = (
+            select(
+                case(
+                    (bounds.c.hi > bounds.c.lo,
+                     func.least(func.width_bucket(filtered.c.price, bounds.c.lo, bounds.c.hi, buckets), buckets)),
+                    else_=1,
+                ).label("bucket"),
+                bounds.c.lo,
+                bounds.c.hi,
+            )
+            # bounds - одна строка: CROSS JOIN явным ON true
+            .select_from(filtered)
+            .join(bounds, true())
+            .subquery("bucketed")
+        )
+        price_q = (
+            select(
+                literal("price"),
+                cast(null(), String),
+                func.jsonb_build_array(bucketed.c.bucket, bucketed.c.lo, bucketed.c.hi, type_=JSONB),
+                func.count(),
+            )
+            .group_by(bucketed.c.bucket, bucketed.c.lo, bucketed.c.hi)
+        )
+
+        result = await self.db.execute(union_all(specs_q, categories_q, price_q))
+
+        specs: dict[str, list[dict]] = {}
+        categories = []
+        price_counts: dict[int, int] = {}
+        lo = hi = None
+        for facet, key, value, count in result.all():
+            if facet == "spec":
+                specs.setdefault(key, []).append({"value": value, "count": count})
+            elif facet == "category":
+                categories.append({"category_id": value, "count": count})
+            else:
+                bucket_no, lo, hi = value
+                price_counts[bucket_no] = count
+
+        for values in specs.values():
+            values.sort(key=lambda v: v["count"], reverse=True)
+        categories.sort(key=lambda c: c["count"], reverse=True)
+
+        # Гистограмма отдается целиком, включая пустые корзины
+        price = []
+        if lo is not None:
+            n = buckets if hi > lo else 1
+            width = (hi - lo) / n
+            for i in range(1, n + 1):
+                price.append({
+                    "min": lo + (i - 1) * width,
+                    "max": hi if i == n else lo + i * width,
+                    "count": price_counts.get(i, 0),
+                })
+
+        return {"specs": specs, "categories": categories, "price": price}
+
+    async def stream_products(self, filters: ProductFilter | None = None) -> AsyncIterator[Product]:
+        """
+        Все товары (с учетом фильтра) по возрастанию id через серверный курсор:
+        строки приходят из БД пачками по EXPORT_CHUNK, весь результат в память не грузится.
+        """
+        query = select(Product).order_by(asc(Product.id)).execution_options(yield_per=self.EXPORT_CHUNK)
+        if filters:
+            query = self._apply_filters(query, filters)
+
+        result = await self.db.stream(query)
+        async for product in result.scalars():
+            yield product
+
+    @staticmethod
+    def _resolve_sort(filters: ProductFilter) -> SortOption:
+        # По умолчанию поиск по строке сортируется по релевантности, каталог - по новизне
+        if filters.sort_by is None:
+            return SortOption.RELEVANCE if filters.q else SortOption.NEWEST
+        if filters.sort_by == SortOption.RELEVANCE and not filters.q:
+            return SortOption.NEWEST
+        return filters.sort_by
+
+    @staticmethod
+    def _text_query(q: str):
+        # websearch_to_tsquery не падает на пользовательском синтаксисе (кавычки, минус, "or")
+        return func.websearch_to_tsquery(cast(FTS_CONFIG, REGCONFIG), q)
+
+    def _rank_expression(self, q: str):
+        """
+        Релевантность: полнотекстовый ранг плюс триграммная похожесть названия,
+        чтобы совпадения с опечаткой не проваливались в конец выдачи.
+        """
+        return (
+            func.ts_rank(Product.search_vector, self._text_query(q), type_=Float)
+            + func.word_similarity(q, Product.name, type_=Float)
+        ).label("rank")
+
+    def _apply_filters(self, query, filters: ProductFilter):
+        """
+        Навешивает на запрос условия WHERE из ProductFilter (без сортировки и пагинации).
+        """
+        # 0. Текстовый поиск: полнотекстовый (GIN по search_vector) или,
+        # для опечаток, триграммный (GIN gin_trgm_ops по name). q <% name - похожесть q
+        # на самый близкий фрагмент названия, а не на все название целиком. OR двух индексируемых
+        # условий превращается в BitmapOr, без последовательного сканирования таблицы
+        if filters.q:
+            query = query.filter(or_(
+                Product.search_vector.op("@@")(self._text_query(filters.q)),
+                literal(filters.q).op("<%")(Product.name),
+            ))
+
+        # 1. Фильтр по категории (с потомками - через таблицу замыкания, один индексный semi-join)
         if filters.category_id:
-            query = query.filter(Product.category_id == filters.category_id)
+            if filters.include_descendants:
+                subtree = (
+                    select(CategoryClosure.descendant_id)
+                    .where(CategoryClosure.ancestor_id == filters.category_id)
+                )
+                query = query.filter(Product.category_id.in_(subtree))
+            else:
+                query = query.filter(Product.category_id == filters.category_id)
 
         # 2. Фильтр по цене
         if filters.price_min is not None:
@@ -43,28 +317,79 @@ class ProductService:
         if filters.price_max is not None:
             query = query.filter(Product.price <= filters.price_max)
 
-        # 3. Фильтр по JSON specs (PostgreSQL specific)
-        # Если передан словарь {"color": "white"}, ищем точное совпадение внутри JSONB
+        # 3. Фильтры по JSON specs (PostgreSQL specific).
+        # Все условия выражены операторами @> и @?, которые обслуживает GIN-индекс по specs.
+
+        # 3.1 Точное совпадение: весь словарь одним предикатом specs @> '{"color": "white", "length_cm": 100}'.
+        # Типы сохраняются: 100 и "100" - разные значения
         if filters.specs_filter:
-            for key, value in filters.specs_filter.items():
-                # Синтаксис SQLA для JSON: Product.specs[key].astext == value
-                # Нужно приведение типов, если value не строка, но для простоты берем строки
-                query = query.filter(Product.specs[key].astext == str(value))
-
-        # 4. Сортировка
-        if filters.sort_by == "price_asc":
-            query = query.order_by(asc(Product.price))
-        elif filters.sort_by == "price_desc":
-            query = query.order_by(desc(Product.price))
+            query = query.filter(Product.specs.contains(filters.specs_filter))
+
+        # 3.2 "Любое из": specs @> '{"color": "white"}' OR specs @> '{"color": "black"}'
+        if filters.specs_any:
+            for key, values in filters.specs_any.items():
+                if values:
+                    query = query.filter(or_(*[Product.specs.contains({key: v}) for v in values]))
+
+        # 3.3 Числовые диапазоны: specs @? '$."length_cm" ? (@ >= 80 && @ <= 110)'.
+        # Строковые значения в jsonpath с числом не сравниваются, поэтому "100" сюда не попадет
+        if filters.specs_range:
+            for key, bounds in filters.specs_range.items():
+                path = self._range_jsonpath(key, bounds)
+                if path:
+                    query = query.filter(Product.specs.op("@?")(cast(path, JSONPATH)))
+
+        return query
+
+    @staticmethod
+    def _range_jsonpath(key: str, bounds: SpecRange) -> str | None:
+        conditions = []
+        if bounds.min is not None:
+            conditions.append(f"@ >= {float(bounds.min)!r}")
+        if bounds.max is not None:
+            conditions.append(f"@ <= {float(bounds.max)!r}")
+        if not conditions:
+            return None
+        # json.dumps экранирует ключ так же, как этого ждет строковый литерал jsonpath
+        return f"$.{json.dumps(key)} ? ({' && '.join(conditions)})"
+
+    @staticmethod
+    def _make_cursor(sort_by: SortOption, row) -> str:
+        last = row[0]
+        if sort_by == SortOption.NEWEST:
+            key = [last.id]
+        elif sort_by == SortOption.RELEVANCE:
+            key = [row[1], last.id]
         else:
-            query = query.order_by(desc(Product.id))  # Newest
+            key = [last.price, last.id]
+        return encode_cursor({"s": sort_by.value, "k": key})
 
-        # 5. Пагинация
-        offset = (filters.page - 1) * filters.limit
-        query = query.offset(offset).limit(filters.limit)
+    @staticmethod
+    def _seek_condition(sort_by: SortOption, cursor: str, rank=None):
+        """
+        Условие "строго после курсора" в виде сравнения кортежей (row value),
+        которое PostgreSQL разворачивает в range scan по составному индексу.
+        """
+        payload = decode_cursor(cursor)
+        key = payload.get("k")
+        if payload.get("s") != sort_by.value or not isinstance(key, list):
+            raise ValueError("Cursor does not match sort order")
 
-        result = await self.db.execute(query)
-        return result.scalars().all()
+        try:
+            if sort_by == SortOption.NEWEST:
+                (last_id,) = key
+                return Product.id < int(last_id)
+
+            last_value, last_id = key
+            if sort_by == SortOption.RELEVANCE:
+                return tuple_(rank, Product.id) < tuple_(float(last_value), int(last_id))
+
+            row = tuple_(Product.price, Product.id)
+            if sort_by == SortOption.PRICE_ASC:
+                return row > tuple_(float(last_value), int(last_id))
+            return row < tuple_(float(last_value), int(last_id))
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor")
 
     async def update_product(self, product_id: int, schema: ProductUpdate) -> Product | None:
         product = await self.get_product_by_id(product_id)
@@ -79,6 +404,7 @@ class ProductService:
         self.db.add(product)
         await self.db.commit()
         await self.db.refresh(product)
+        product_cache.delete(product_id)
         return product
 
     async def delete_product(self, product_id: int) -> bool:
@@ -88,4 +414,5 @@ class ProductService:
 
         await self.db.delete(product)
         await self.db.commit()
+        product_cache.delete(product_id)
         return True
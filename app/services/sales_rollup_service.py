@@ -0,0 +1,192 @@
+import datetime
+
+from sqlalchemy import select, delete, func, desc, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.models import DailySales, Order, OrderItem, Product, ProductDailySales, SalesRollupOrder
+
+
+# Ключ advisory-блокировки агрегатов: пересчет берет ее монопольно, приращения заказов - совместно
+ROLLUP_LOCK_KEY = 0x5A1E5
+
+
+def _order_day(created_at):
+    # Границы суток считаем в UTC независимо от часового пояса сессии БД
+    return func.date(func.timezone("UTC", created_at))
+
+
+class SalesRollupService:
+    """
+    Поддерживает агрегаты продаж (daily_sales, product_daily_sales) и отвечает по ним.
+    Новые заказы прибавляются к агрегатам обработчиком события order.created (record_order),
+    вне транзакции checkout: строка дня - общая для всех заказов, и ее блокировка
+    сериализовала бы оформление. Полный пересчет по orders нужен только для первичного заполнения (rebuild).
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def record_order(self, order_id: int) -> None:
+        """
+        Прибавляет заказ к агрегатам (коммит - за вызывающим). Повторный вызов
+        для того же заказа ничего не делает: отметка в sales_rollup_orders пишется
+        в той же транзакции, что и приращения.
+        """
+        # Не пересекаемся с полным пересчетом (rebuild), друг друга заказы не ждут
+        await self.db.execute(select(func.pg_advisory_xact_lock_shared(ROLLUP_LOCK_KEY)))
+        marked = await self.db.scalar(
+            insert(SalesRollupOrder)
+            .values(order_id=order_id)
+            .on_conflict_do_nothing(index_elements=[SalesRollupOrder.order_id])
+            .returning(SalesRollupOrder.order_id)
+        )
+        if marked is None:
+            return
+
+        stmt = insert(DailySales).from_select(
+            ["day", "order_count", "revenue"],
+            select(_order_day(Order.created_at), literal(1), Order.total_price).where(Order.id == order_id),
+        )
+        await self.db.execute(stmt.on_conflict_do_update(
+            index_elements=[DailySales.day],
+            set_={
+                "order_count": DailySales.order_count + stmt.excluded.order_count,
+                "revenue": DailySales.revenue + stmt.excluded.revenue,
+            },
+        ))
+
+        day = _order_day(Order.created_at)
+        stmt = insert(ProductDailySales).from_select(
+            ["day", "product_id", "units", "revenue"],
+            select(
+                day,
+                OrderItem.product_id,
+                func.sum(OrderItem.quantity),
+                func.sum(OrderItem.quantity * OrderItem.price_at_purchase),
+            )
+            .join(Order, Order.id == OrderItem.order_id)
+            .where(OrderItem.order_id == order_id)
+            .group_by(day, OrderItem.product_id)
+            # Один порядок блокировки строк у параллельных заказов - без взаимных блокировок
+            .order_by(OrderItem.product_id),
+        )
+        await self.db.execute(stmt.on_conflict_do_update(
+            index_elements=[ProductDailySales.day, ProductDailySales.product_id],
+            set_={
+                "units": ProductDailySales.units + stmt.excluded.units,
+                "revenue": ProductDailySales.revenue + stmt.excluded.revenue,
+            },
+        ))
+
+    async def ensure_rollups(self) -> None:
+        """
+        Заполняет агрегаты по истории заказов, если они пусты (заказы созданы до их появления).
+        Воркеры стартуют одновременно: проверка идет под блокировкой, и пересчет выполнит только первый.
+        """
+        await self._lock_exclusive()
+        has_rollups = await self.db.scalar(select(literal(1)).select_from(DailySales).limit(1))
+        has_orders = await self.db.scalar(select(literal(1)).select_from(Order).limit(1))
+        if has_orders and not has_rollups:
+            await self.rebuild()
+        else:
+            await self.db.commit()
+
+    async def rebuild(self) -> None:
+        """
+        Полный пересчет агрегатов двумя INSERT ... SELECT GROUP BY.
+        Выполняется под монопольной блокировкой: параллельный пересчет или приращение
+        от обработчика outbox ждут его коммита. Агрегаты считаются только по отмеченным
+        заказам, поэтому заказ, закоммиченный посреди пересчета, учтет его обработчик.
+        """
+        day = _order_day(Order.created_at)
+
+        await self._lock_exclusive()
+        await self.db.execute(delete(DailySales))
+        await self.db.execute(delete(ProductDailySales))
+        await self.db.execute(delete(SalesRollupOrder))
+        await self.db.execute(
+            insert(SalesRollupOrder).from_select(["order_id"], select(Order.id))
+        )
+        await self.db.execute(
+            insert(DailySales).from_select(
+                ["day", "order_count", "revenue"],
+                select(day, func.count(), func.sum(Order.total_price))
+                .join(SalesRollupOrder, SalesRollupOrder.order_id == Order.id)
+                .group_by(day),
+            )
+        )
+        await self.db.execute(
+            insert(ProductDailySales).from_select(
+                ["day", "product_id", "units", "revenue"],
+                select(
+                    day,
+                    OrderItem.product_id,
+                    func.sum(OrderItem.quantity),
+                    func.sum(OrderItem.quantity * OrderItem.price_at_purchase),
+                )
+                .join(Order, Order.id == OrderItem.order_id)
+                .join(SalesRollupOrder, SalesRollupOrder.order_id == Order.id)
+                .group_by(day, OrderItem.product_id),
+            )
+        )
+        await self.db.commit()
+
+    async def _lock_exclusive(self) -> None:
+        # Снимается сама при коммите или откате транзакции
+        await self.db.execute(select(func.pg_advisory_xact_lock(ROLLUP_LOCK_KEY)))
+
+    async def get_daily_sales(self, date_from: datetime.date, date_to: datetime.date) -> dict:
+        """
+        Выручка и число заказов по дням за период (включительно) и итог за период.
+        Дни без заказов в ответ не попадают.
+        """
+        result = await self.db.execute(
+            select(DailySales.day, DailySales.order_count, DailySales.revenue)
+            .where(DailySales.day.between(date_from, date_to))
+            .order_by(DailySales.day)
+        )
+        days = result.all()
+        return {
+            "days": days,
+            "order_count": sum(row.order_count for row in days),
+            "revenue": sum(row.revenue for row in days),
+        }
+
+    async def get_top_products(self, date_from: datetime.date, date_to: datetime.date, limit: int) -> list:
+        """
+        Бестселлеры за период по проданным единицам.
+        """
+        units = func.sum(ProductDailySales.units).label("units")
+        top = (
+            select(
+                ProductDailySales.product_id,
+                units,
+                func.sum(ProductDailySales.revenue).label("revenue"),
+            )
+            .where(ProductDailySales.day.between(date_from, date_to))
+            .group_by(ProductDailySales.product_id)
+            .order_by(desc(units), ProductDailySales.product_id)
+            .limit(limit)
+        ).subquery("top")
+
+        result = await self.db.execute(
+            select(top.c.product_id, Product.name, top.c.units, top.c.revenue)
+            .outerjoin(Product, Product.id == top.c.product_id)
+            .order_by(desc(top.c.units), top.c.product_id)
+        )
+        return result.all()
+
+    async def get_product_sales(self, product_id: int, date_from: datetime.date, date_to: datetime.date) -> list:
+        """
+        Продажи одного товара по дням (индекс ix_product_daily_sales_product_day).
+        """
+        result = await self.db.execute(
+            select(ProductDailySales.day, ProductDailySales.units, ProductDailySales.revenue)
+            .where(
+                ProductDailySales.product_id == product_id,
+                ProductDailySales.day.between(date_from, date_to),
+            )
+            .order_by(ProductDailySales.day)
+        )
+        return result.all()
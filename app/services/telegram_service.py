@@ -1,11 +1,18 @@
 import hashlib
 import hmac
 import time
+from functools import lru_cache
 from fastapi import HTTPException
 from app.core.config import settings
 from app.schemas.telegram import TelegramAuth
 
 
+@lru_cache(maxsize=1)
+def _secret_key(bot_token: str) -> bytes:
+    # Секретный ключ - SHA256 от токена бота; считается один раз
+    return hashlib.sha256(bot_token.encode()).digest()
+
+
 def validate_telegram_data(data: TelegramAuth) -> bool:
     """
     Проверяет HMAC-SHA256 подпись данных от Telegram.
@@ -36,11 +43,11 @@ def validate_telegram_data(data: TelegramAuth) -> bool:
     # Собираем строку через перевод строки
     data_check_string = "\n".join(check_arr)
 
-    # 3. Вычисляем секретный ключ (SHA256 от токена бота)
-    secret_key = hashlib.sha256(settings.TG_BOT_TOKEN.encode()).digest()
+    # 3. Секретный ключ (SHA256 от токена бота)
+    secret_key = _secret_key(settings.TG_BOT_TOKEN)
 
     # 4. Вычисляем HMAC-SHA256
     hash_calc = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
 
-    # 5. Сравниваем
-    return hash_calc == data.hash
\ No newline at end of file
+    # 5. Сравниваем (за постоянное время)
+    return hmac.compare_digest(hash_calc, data.hash)
\ No newline at end of file
@@ -0,0 +1,167 @@
+import asyncio
+import datetime
+import uuid
+
+from sqlalchemy import select, update, delete, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.security import (
+    REFRESH_TOKEN_EXPIRE_DAYS,
+    access_token_cache,
+    create_access_token,
+    create_refresh_token,
+    hash_refresh_token,
+)
+from app.db.session import AsyncSessionLocal
+from app.models.models import RefreshToken
+
+
+class TokenService:
+    """
+    Выдача пары access + refresh и ротация refresh-токенов.
+    Обмен refresh-токена - один UPDATE по уникальному индексу token_hash, без bcrypt.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def issue_tokens(self, user_id: int) -> dict:
+        """
+        Пара токенов после входа: refresh-токен открывает новую цепочку ротации.
+        """
+        refresh_token = await self._add_refresh_token(user_id, uuid.uuid4().hex)
+        await self.db.commit()
+        return self._token_pair(user_id, refresh_token)
+
+    async def refresh(self, refresh_token: str) -> dict:
+        """
+        Обменивает refresh-токен на новую пару. Старый токен становится использованным.
+        Повторное предъявление использованного токена (признак кражи) отзывает всю цепочку
+        и access-токены пользователя. Исключение - повтор в течение REFRESH_TOKEN_REUSE_GRACE секунд
+        после обмена: так выглядят параллельные обновления из двух вкладок, поэтому запрос просто
+        отклоняется, а цепочка и выданная другой вкладке пара остаются в силе. Ошибка - ValueError.
+        """
+        token_hash = hash_refresh_token(refresh_token)
+        # Проверка и погашение одним запросом: из двух параллельных обменов пройдет только один
+        current = (await self.db.execute(
+            update(RefreshToken)
+            .where(
+                RefreshToken.token_hash == token_hash,
+                RefreshToken.used_at.is_(None),
+                RefreshToken.revoked_at.is_(None),
+                RefreshToken.expires_at > func.now(),
+            )
+            .values(used_at=func.now())
+            .returning(RefreshToken.user_id, RefreshToken.family_id)
+            .execution_options(synchronize_session=False)
+        )).first()
+
+        if current is None:
+            await self._detect_reuse(token_hash)
+            raise ValueError("Invalid refresh token")
+
+        new_token = await self._add_refresh_token(current.user_id, current.family_id)
+        await self.db.commit()
+        return self._token_pair(current.user_id, new_token)
+
+    async def revoke(self, refresh_token: str) -> None:
+        """
+        Выход: отзывает цепочку, к которой относится токен.
+        """
+        family = await self.db.execute(
+            select(RefreshToken.user_id, RefreshToken.family_id)
+            .where(RefreshToken.token_hash == hash_refresh_token(refresh_token))
+        )
+        family = family.first()
+        if family:
+            await self._revoke_family(family.family_id)
+            await self.db.commit()
+
+    async def revoke_user(self, user_id: int) -> None:
+        """
+        Отзывает все refresh-токены пользователя и его действующие access-токены.
+        """
+        await self.db.execute(
+            update(RefreshToken)
+            .where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+            .values(revoked_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.commit()
+        await access_token_cache.revoke_user_tokens(user_id)
+
+    async def purge_expired(self) -> int:
+        """
+        Удаляет просроченные и отозванные токены. Использованные, но еще не истекшие
+        остаются: по ним распознается повторное использование.
+        """
+        result = await self.db.execute(
+            delete(RefreshToken).where(or_(
+                RefreshToken.expires_at < func.now(),
+                RefreshToken.revoked_at.is_not(None),
+            ))
+        )
+        await self.db.commit()
+        return result.rowcount
+
+    async def _detect_reuse(self, token_hash: str) -> None:
+        # Сюда попадаем только при неудачном обмене: выясняем, не был ли токен уже использован.
+        # Давность обмена считает БД - часы воркеров не участвуют
+        grace = datetime.timedelta(seconds=settings.REFRESH_TOKEN_REUSE_GRACE)
+        result = await self.db.execute(
+            select(
+                RefreshToken.user_id,
+                RefreshToken.family_id,
+                RefreshToken.used_at,
+                (RefreshToken.used_at > func.now() - grace).label("just_used"),
+            )
+            .where(RefreshToken.token_hash == token_hash)
+        )
+        stored = result.first()
+        if stored is not None and stored.used_at is not None and not stored.just_used:
+            print(f"Refresh token reuse detected: user={stored.user_id} family={stored.family_id}")
+            await self._revoke_family(stored.family_id)
+            await self.db.commit()
+            await access_token_cache.revoke_user_tokens(stored.user_id)
+
+    async def _revoke_family(self, family_id: str) -> None:
+        await self.db.execute(
+            update(RefreshToken)
+            .where(RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None))
+            .values(revoked_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+
+    async def _add_refresh_token(self, user_id: int, family_id: str) -> str:
+        token = create_refresh_token()
+        self.db.add(RefreshToken(
+            user_id=user_id,
+            token_hash=hash_refresh_token(token),
+            family_id=family_id,
+            expires_at=datetime.datetime.now(datetime.timezone.utc)
+            + datetime.timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+        ))
+        await self.db.flush()
+        return token
+
+    @staticmethod
+    def _token_pair(user_id: int, refresh_token: str) -> dict:
+        return {
+            "access_token": create_access_token(user_id),
+            "refresh_token": refresh_token,
+            "token_type": "bearer",
+        }
+
+
+async def purge_refresh_tokens_periodically(interval: float) -> None:
+    """
+    Фоновая задача (запускается из lifespan): раз в interval секунд чистит refresh_tokens.
+    """
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                await TokenService(session).purge_expired()
+        except Exception as e:
+            print(f"Refresh token purge error: {e}")
+        await asyncio.sleep(interval)
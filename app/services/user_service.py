@@ -1,10 +1,12 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update, func, case
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
 from typing import Optional
 
 from app.models.models import User
-from app.schemas.user import UserCreate
-from app.core.security import get_password_hash, verify_password
+from app.schemas.user import UserCreate, TELEGRAM_EMAIL_DOMAIN
+from app.core.security import password_hasher
 
 class UserService:
     def __init__(self, db: AsyncSession):
@@ -14,25 +16,83 @@ class UserService:
         result = await self.db.execute(select(User).where(User.email == email))
         return result.scalar_one_or_none()
 
-    async def create_user(self, user_in: UserCreate) -> User:
-        # Проверка на существование выносится на уровень выше или делается здесь с raise Exception
-        # Но для атомарности метода лучше просто создавать
-        user = User(
-            email=user_in.email,
-            hashed_password=get_password_hash(user_in.password)
+    async def create_user(self, user_in: UserCreate) -> Optional[User]:
+        """
+        Регистрация одним INSERT ... ON CONFLICT (email) DO NOTHING RETURNING.
+        Возвращает None, если email уже занят (в том числе параллельной регистрацией).
+        """
+        # bcrypt считается в пуле password_hasher, не блокируя event loop
+        hashed_password = await password_hasher.hash(user_in.password)
+        stmt = (
+            insert(User)
+            .values(email=user_in.email, hashed_password=hashed_password)
+            .on_conflict_do_nothing(index_elements=[User.email])
+            .returning(User)
+        )
+        user = await self.db.scalar(stmt)
+        await self.db.commit()
+        return user
+
+    async def get_or_create_external_user(self, provider: str, provider_user_id: str, email: str) -> User:
+        """
+        Find-or-create для входа через Telegram / соцсети: один upsert по (provider, provider_user_id),
+        без пароля и без bcrypt. Заодно отмечает время входа.
+        """
+        stmt = insert(User).values(
+            email=email,
+            provider=provider,
+            provider_user_id=provider_user_id,
+            last_login_at=func.now(),
         )
-        self.db.add(user)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[User.provider, User.provider_user_id],
+            set_={"last_login_at": stmt.excluded.last_login_at},
+        ).returning(User)
+
+        try:
+            user = await self.db.scalar(stmt, execution_options={"populate_existing": True})
+        except IntegrityError:
+            # Email уже занят учетной записью без привязки (регистрация по паролю
+            # или пользователь Telegram, созданный до появления provider) - привязываем ее
+            await self.db.rollback()
+            user = await self._link_by_email(provider, provider_user_id, email)
+            if user is None:
+                raise ValueError("Email is already used by another account")
         await self.db.commit()
-        await self.db.refresh(user)
         return user
 
+    async def _link_by_email(self, provider: str, provider_user_id: str, email: str) -> Optional[User]:
+        # Технические email Telegram привязываются только к Telegram (и наоборот):
+        # соцсеть не может получить старый Telegram-аккаунт, Telegram - обычный
+        is_telegram_email = email.lower().endswith("@" + TELEGRAM_EMAIL_DOMAIN)
+        if is_telegram_email != (provider == "telegram"):
+            return None
+
+        unlinked = User.provider.is_(None)
+        stmt = (
+            update(User)
+            .where(User.email == email)
+            .values(
+                provider=case((unlinked, provider), else_=User.provider),
+                provider_user_id=case((unlinked, provider_user_id), else_=User.provider_user_id),
+                last_login_at=func.now(),
+            )
+            .returning(User)
+        )
+        return await self.db.scalar(stmt, execution_options={"populate_existing": True})
+
     async def authenticate_user(self, email: str, password: str) -> Optional[User]:
         """
         Возвращает юзера, если пароль совпал, иначе None.
         """
         user = await self.get_by_email(email)
-        if not user:
+        if not user or not user.hashed_password:
             return None
-        if not verify_password(password, user.hashed_password):
+        verified, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+        if not verified:
             return None
-        return user
\ No newline at end of file
+        if new_hash:
+            # Сменилась стоимость bcrypt (BCRYPT_ROUNDS) - тихо пересчитываем хеш
+            await self.db.execute(update(User).where(User.id == user.id).values(hashed_password=new_hash))
+            await self.db.commit()
+        return user
@@ -0,0 +1,24 @@
+import os
+
+# Настройки читаются при импорте app: без .env движок БД не соберет URL, а кэши пошли бы в Redis.
+# Базу для тестов с PostgreSQL задает TEST_DATABASE_URL (см. tests/db.py)
+for name, value in {"DB_USER": "test", "DB_PASS": "test", "DB_HOST": "localhost", "DB_PORT": "5432", "DB_NAME": "test"}.items():
+    os.environ.setdefault(name, value)
+os.environ["REDIS_URL"] = ""
+
+import pytest
+
+from tests.oauth_stub import OAuthStub
+
+
+@pytest.fixture(scope="session")
+def _oauth_stub_server():
+    stub = OAuthStub().start()
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def oauth_stub(_oauth_stub_server):
+    _oauth_stub_server.reset()
+    return _oauth_stub_server
@@ -0,0 +1,33 @@
+"""
+Тесты, которым нужен PostgreSQL (SKIP LOCKED, ON CONFLICT, now() и т.п. не подменить SQLite).
+База задается TEST_DATABASE_URL (postgresql+asyncpg://...) и пересоздается в каждом тесте.
+"""
+import os
+from contextlib import asynccontextmanager
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.db.session import Base
+from app.models import models  # noqa: F401 - регистрирует таблицы в Base.metadata
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+requires_db = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+
+@asynccontextmanager
+async def fresh_database():
+    """
+    Чистая схема и фабрика сессий к ней.
+    """
+    engine = create_async_engine(TEST_DATABASE_URL)
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        yield async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+    finally:
+        await engine.dispose()
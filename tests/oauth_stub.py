@@ -0,0 +1,80 @@
+"""
+Локальный сервер-заглушка OAuth-провайдера для тестов предохранителя и пула соединений.
+Адреса провайдеров настраиваются (VK_OAUTH_URL, YANDEX_OAUTH_URL, YANDEX_LOGIN_URL),
+поэтому клиентов из app.core.oauth можно направить на него.
+
+    stub.status = 503   # все ответы - 503
+    stub.delay = 2.0    # ответ через 2 секунды (таймауты, отмена)
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class OAuthStub:
+    def __init__(self):
+        self.status = 200
+        self.delay = 0.0
+        self.requests: list[str] = []
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self) -> "OAuthStub":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self) -> None:
+        self.status = 200
+        self.delay = 0.0
+        self.requests.clear()
+
+    def _respond(self, path: str) -> tuple[int, dict]:
+        self.requests.append(path)
+        if self.delay:
+            time.sleep(self.delay)
+        if self.status != 200:
+            return self.status, {"error": "unavailable"}
+        if path.endswith(("/token", "/access_token")):
+            return 200, {"access_token": "stub-token", "token_type": "bearer", "expires_in": 3600}
+        if path.endswith("/info"):
+            return 200, {"id": "42", "default_email": "user@example.com"}
+        return 404, {"error": "not_found"}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                status, body = stub._respond(self.path.split("?")[0])
+                payload = json.dumps(body).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Клиент не дождался ответа (таймаут, отмена)
+                    pass
+
+            do_GET = _send
+            do_POST = _send
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from app.models.models import Category, Product, User
+from app.schemas.cart import CartOperation
+from app.services.cart_service import CartService, fold_operations
+from app.services.cart_storage import SqlCartStorage
+from tests.db import requires_db, fresh_database
+
+
+def _ops(*items) -> list[CartOperation]:
+    return [CartOperation(op=op, product_id=pid, quantity=q) for op, pid, q in items]
+
+
+def _apply_one_by_one(cart: dict[int, int], operations: list[CartOperation]) -> dict[int, int]:
+    # Эталон: операции по одной, как если бы клиент вызывал add/update/remove
+    cart = dict(cart)
+    for operation in operations:
+        if operation.op.value == "add":
+            cart[operation.product_id] = cart.get(operation.product_id, 0) + operation.quantity
+        elif operation.op.value == "set":
+            cart[operation.product_id] = operation.quantity
+        else:
+            cart.pop(operation.product_id, None)
+    return cart
+
+
+def _apply_folded(cart: dict[int, int], operations: list[CartOperation]) -> dict[int, int]:
+    removed, absolute, delta = fold_operations(operations)
+    cart = {pid: q for pid, q in cart.items() if pid not in removed}
+    cart.update(absolute)
+    for pid, q in delta:
+        cart[pid] = cart.get(pid, 0) + q
+    return cart
+
+
+def test_adds_are_summed():
+    assert fold_operations(_ops(("add", 1, 2), ("add", 1, 3))) == ([], [], [(1, 5)])
+
+
+def test_set_then_add_is_absolute():
+    assert fold_operations(_ops(("set", 1, 2), ("add", 1, 3))) == ([], [(1, 5)], [])
+
+
+def test_add_then_set_overrides():
+    assert fold_operations(_ops(("add", 1, 2), ("set", 1, 7))) == ([], [(1, 7)], [])
+
+
+def test_add_then_remove_removes():
+    assert fold_operations(_ops(("add", 1, 2), ("remove", 1, None))) == ([1], [], [])
+
+
+def test_remove_then_add_sets_quantity():
+    # Позиция могла быть в корзине: удаление + добавление = ровно добавленное количество
+    assert fold_operations(_ops(("remove", 1, None), ("add", 1, 4))) == ([], [(1, 4)], [])
+
+
+def test_one_action_per_product():
+    removed, absolute, delta = fold_operations(_ops(
+        ("add", 1, 1), ("set", 2, 3), ("remove", 3, None), ("add", 2, 1), ("add", 1, 1),
+    ))
+    assert (removed, absolute, delta) == ([3], [(2, 4)], [(1, 2)])
+
+
+@pytest.mark.parametrize("operations", [
+    _ops(("add", 1, 1), ("add", 2, 2), ("remove", 1, None), ("add", 1, 5)),
+    _ops(("set", 3, 1), ("remove", 3, None), ("set", 3, 2), ("add", 3, 2)),
+    _ops(("remove", 2, None), ("add", 4, 1), ("set", 1, 9), ("add", 2, 1)),
+])
+def test_folding_matches_one_by_one(operations):
+    cart = {1: 2, 2: 1, 3: 5}
+    assert _apply_folded(cart, operations) == _apply_one_by_one(cart, operations)
+
+
+@requires_db
+def test_sql_batch_matches_one_by_one():
+    operations = _ops(
+        ("add", 1, 2), ("set", 2, 3), ("add", 3, 1), ("remove", 3, None),
+        ("add", 2, 1), ("set", 1, 1), ("add", 1, 4), ("remove", 4, None),
+    )
+
+    async def scenario():
+        async with fresh_database() as session_factory:
+            async with session_factory() as session:
+                user = User(email="user@example.com", hashed_password=None)
+                category = Category(name="Шубы")
+                session.add_all([user, category])
+                await session.flush()
+                session.add_all([
+                    Product(id=pid, name=f"Товар {pid}", price=100.0, specs={}, category_id=category.id)
+                    for pid in (1, 2, 3, 4)
+                ])
+                await session.commit()
+
+            async with session_factory() as session:
+                service = CartService(session, SqlCartStorage(session))
+                await service.add_item(user.id, 4, 2)
+                await service.add_item(user.id, 2, 5)
+                cart = await service.apply_operations(user.id, operations)
+                return {item.product_id: item.quantity for item in cart.items}
+
+    assert asyncio.run(scenario()) == _apply_one_by_one({4: 2, 2: 5}, operations)
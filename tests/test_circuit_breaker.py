@@ -0,0 +1,178 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.core import oauth
+from app.core.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.core.config import settings
+
+
+@pytest.fixture
+def breaker():
+    oauth.breakers["stub"] = CircuitBreaker("stub", failure_threshold=2, reset_timeout=0)
+    yield oauth.breakers["stub"]
+    del oauth.breakers["stub"]
+
+
+def _get(url: str, timeout: float = 5.0):
+    async def call():
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            resp = await client.get(url)
+            resp.raise_for_status()
+            return resp.json()
+    return call
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("svc", failure_threshold=3, reset_timeout=60)
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.rejected == 1
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker("svc", failure_threshold=2, reset_timeout=60)
+    breaker.before_call()
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_success()
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == "closed"
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker("svc", failure_threshold=1, reset_timeout=0)
+    breaker.before_call()
+    breaker.record_failure()
+
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("svc", failure_threshold=5, reset_timeout=0)
+    for _ in range(5):
+        breaker.before_call()
+        breaker.record_failure()
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_provider_errors_open_breaker(oauth_stub, breaker):
+    oauth_stub.status = 503
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(httpx.HTTPStatusError):
+                await oauth.call_provider("stub", _get(f"{oauth_stub.url}/info"))
+        breaker.reset_timeout = 60
+        with pytest.raises(CircuitOpenError):
+            await oauth.call_provider("stub", _get(f"{oauth_stub.url}/info"))
+
+    asyncio.run(scenario())
+    assert breaker.state == "open"
+    # Отклоненный вызов до сервера не дошел
+    assert len(oauth_stub.requests) == 2
+
+
+def test_client_errors_do_not_count(oauth_stub, breaker):
+    oauth_stub.status = 400
+
+    async def scenario():
+        for _ in range(3):
+            with pytest.raises(httpx.HTTPStatusError):
+                await oauth.call_provider("stub", _get(f"{oauth_stub.url}/token"))
+
+    asyncio.run(scenario())
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+def test_timeout_counts_as_failure(oauth_stub, breaker):
+    oauth_stub.delay = 0.5
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(httpx.TimeoutException):
+                await oauth.call_provider("stub", _get(f"{oauth_stub.url}/info", timeout=0.1))
+
+    asyncio.run(scenario())
+    assert breaker.state == "open"
+
+
+def test_cancelled_probe_releases_slot(oauth_stub, breaker):
+    async def scenario():
+        breaker.before_call()
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+        # Пробный вызов в half_open отменяется на полпути
+        oauth_stub.delay = 1.0
+        probe = asyncio.create_task(oauth.call_provider("stub", _get(f"{oauth_stub.url}/info")))
+        await asyncio.sleep(0.2)
+        assert breaker.state == "half_open"
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        # Слот освобожден: следующий пробный вызов проходит и закрывает предохранитель
+        oauth_stub.delay = 0.0
+        return await oauth.call_provider("stub", _get(f"{oauth_stub.url}/info"))
+
+    assert asyncio.run(scenario())["id"] == "42"
+    assert breaker.state == "closed"
+
+
+def test_provider_client_against_stub(oauth_stub, monkeypatch):
+    # Настоящий клиент провайдера (общий пул, таймауты из настроек), направленный на заглушку
+    monkeypatch.setattr(settings, "YANDEX_CLIENT_ID", "stub-client")
+    monkeypatch.setattr(settings, "YANDEX_CLIENT_SECRET", "stub-secret")
+    monkeypatch.setattr(settings, "YANDEX_OAUTH_URL", oauth_stub.url)
+    monkeypatch.setattr(settings, "YANDEX_LOGIN_URL", oauth_stub.url)
+    monkeypatch.setattr(settings, "VK_CLIENT_ID", None)
+    monkeypatch.setattr(settings, "OAUTH_BREAKER_FAILURES", 2)
+
+    async def scenario():
+        oauth.init_oauth_clients()
+        client = oauth.get_oauth_client("yandex")
+        token = {"access_token": "stub-token", "token_type": "bearer"}
+
+        async def fetch_info():
+            resp = await client.get("info", token=token)
+            resp.raise_for_status()
+            return resp.json()
+
+        try:
+            info = await oauth.call_provider("yandex", fetch_info)
+            oauth_stub.status = 502
+            for _ in range(2):
+                with pytest.raises(httpx.HTTPStatusError):
+                    await oauth.call_provider("yandex", fetch_info)
+            with pytest.raises(CircuitOpenError):
+                await oauth.call_provider("yandex", fetch_info)
+            return info
+        finally:
+            await oauth.close_oauth_clients()
+            oauth._clients.pop("yandex", None)
+            oauth.breakers.pop("yandex", None)
+
+    assert asyncio.run(scenario())["default_email"] == "user@example.com"
+    assert len(oauth_stub.requests) == 3
@@ -0,0 +1,148 @@
+import asyncio
+import datetime
+
+import pytest
+from sqlalchemy import select, update, func
+
+from app.core.config import settings
+from app.models.models import OutboxEvent
+from app.services import outbox_service
+from app.services.outbox_service import OutboxService, OutboxWorker
+from tests.db import requires_db, fresh_database
+
+pytestmark = requires_db
+
+
+@pytest.fixture
+def handlers():
+    # Обработчики тестовых событий; реестр общий для процесса - восстанавливаем после теста
+    saved = dict(outbox_service._handlers)
+    yield outbox_service.outbox_handler
+    outbox_service._handlers.clear()
+    outbox_service._handlers.update(saved)
+
+
+async def _add_events(session_factory, event_type: str, count: int) -> None:
+    async with session_factory() as session:
+        service = OutboxService(session)
+        for i in range(count):
+            await service.add_event(event_type, {"n": i})
+        await session.commit()
+
+
+async def _events(session_factory) -> list:
+    async with session_factory() as session:
+        result = await session.execute(select(OutboxEvent).order_by(OutboxEvent.id))
+        return result.scalars().all()
+
+
+def test_concurrent_claims_do_not_overlap(monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_BATCH_SIZE", 10)
+
+    async def scenario():
+        async with fresh_database() as session_factory:
+            await _add_events(session_factory, "test.event", 25)
+            workers = [OutboxWorker(session_factory) for _ in range(3)]
+
+            async def claim(worker):
+                async with session_factory() as session:
+                    return [event.id for event in await worker._claim(session)]
+
+            claimed = await asyncio.gather(*(claim(worker) for worker in workers))
+            # Аренда закоммичена: пока она не истекла, события больше никто не возьмет
+            again = await claim(workers[0])
+            return claimed, again
+
+    claimed, again = asyncio.run(scenario())
+    ids = [event_id for batch in claimed for event_id in batch]
+    assert len(ids) == len(set(ids)) == 25
+    assert all(len(batch) <= 10 for batch in claimed)
+    assert again == []
+
+
+def test_expired_lease_is_claimed_again():
+    async def scenario():
+        async with fresh_database() as session_factory:
+            await _add_events(session_factory, "test.event", 1)
+            worker = OutboxWorker(session_factory)
+            async with session_factory() as session:
+                first = await worker._claim(session)
+
+                # Воркер, взявший событие, упал: аренда истекает
+                await session.execute(
+                    update(OutboxEvent).values(available_at=func.now() - datetime.timedelta(seconds=1))
+                )
+                await session.commit()
+
+                second = await worker._claim(session)
+            return first, second
+
+    first, second = asyncio.run(scenario())
+    assert [event.id for event in second] == [event.id for event in first]
+    assert second[0].attempts == 2
+
+
+def test_processed_events_are_marked_done(handlers):
+    received = []
+
+    @handlers("test.ok")
+    async def handle(payload: dict) -> None:
+        received.append(payload["n"])
+
+    async def scenario():
+        async with fresh_database() as session_factory:
+            await _add_events(session_factory, "test.ok", 3)
+            worker = OutboxWorker(session_factory)
+            claimed = await worker.process_batch()
+            return claimed, await _events(session_factory), worker
+
+    claimed, events, worker = asyncio.run(scenario())
+    assert claimed == 3
+    assert received == [0, 1, 2]
+    assert {event.status for event in events} == {"done"}
+    assert worker.processed == 3
+
+
+def test_failed_handler_is_retried_then_marked_failed(handlers, monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_MAX_ATTEMPTS", 2)
+
+    @handlers("test.broken")
+    async def handle(payload: dict) -> None:
+        raise RuntimeError("boom")
+
+    async def scenario():
+        async with fresh_database() as session_factory:
+            await _add_events(session_factory, "test.broken", 1)
+            worker = OutboxWorker(session_factory)
+
+            await worker.process_batch()
+            (after_first,) = await _events(session_factory)
+            # Пауза перед повтором: сразу событие не берется
+            assert await worker.process_batch() == 0
+
+            async with session_factory() as session:
+                await session.execute(update(OutboxEvent).values(available_at=func.now()))
+                await session.commit()
+            await worker.process_batch()
+            (after_second,) = await _events(session_factory)
+            return after_first, after_second, worker
+
+    after_first, after_second, worker = asyncio.run(scenario())
+    assert after_first.status == "pending"
+    assert after_first.attempts == 1
+    assert after_first.last_error == "RuntimeError: boom"
+    assert after_second.status == "failed"
+    assert after_second.attempts == 2
+    assert (worker.retried, worker.failed) == (1, 1)
+
+
+def test_event_without_handler_is_not_lost():
+    async def scenario():
+        async with fresh_database() as session_factory:
+            await _add_events(session_factory, "test.unknown", 1)
+            await OutboxWorker(session_factory).process_batch()
+            return await _events(session_factory)
+
+    (event,) = asyncio.run(scenario())
+    assert event.status == "pending"
+    assert event.last_error.startswith("LookupError")
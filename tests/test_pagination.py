@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.core.pagination import encode_cursor, decode_cursor
+from app.models.models import Category, Product
+from app.schemas.product import ProductFilter, SortOption
+from app.services.product_service import ProductService
+from tests.db import requires_db, fresh_database
+
+
+def _sql(condition) -> str:
+    return str(condition.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def test_cursor_round_trip():
+    payload = {"s": "price_asc", "k": [1999.5, 42]}
+    cursor = encode_cursor(payload)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == payload
+
+
+@pytest.mark.parametrize("cursor", ["", "!!!", encode_cursor({"s": "newest"})[:-2] + "@@"])
+def test_broken_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_non_object_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor([1, 2]))
+
+
+@pytest.mark.parametrize("sort_by, expected", [
+    (SortOption.PRICE_ASC, "(products.price, products.id) > (10.5, 7)"),
+    (SortOption.PRICE_DESC, "(products.price, products.id) < (10.5, 7)"),
+    (SortOption.NEWEST, "products.id < 7"),
+])
+def test_make_cursor_seeks_after_last_row(sort_by, expected):
+    row = (Product(id=7, price=10.5),)
+    cursor = ProductService._make_cursor(sort_by, row)
+
+    assert _sql(ProductService._seek_condition(sort_by, cursor)) == expected
+
+
+def test_cursor_from_other_sort_is_rejected():
+    cursor = ProductService._make_cursor(SortOption.NEWEST, (Product(id=7, price=10.5),))
+    with pytest.raises(ValueError):
+        ProductService._seek_condition(SortOption.PRICE_ASC, cursor)
+
+
+def test_tampered_cursor_key_is_rejected():
+    cursor = encode_cursor({"s": "price_asc", "k": ["cheap", 7]})
+    with pytest.raises(ValueError):
+        ProductService._seek_condition(SortOption.PRICE_ASC, cursor)
+
+
+@requires_db
+@pytest.mark.parametrize("sort_by", [SortOption.PRICE_ASC, SortOption.PRICE_DESC, SortOption.NEWEST])
+def test_cursor_walk_returns_every_product_once(sort_by):
+    async def scenario():
+        async with fresh_database() as session_factory:
+            async with session_factory() as session:
+                category = Category(name="Шубы")
+                session.add(category)
+                await session.flush()
+                # Повторяющиеся цены: порядок внутри одной цены держится на id
+                session.add_all([
+                    Product(name=f"Товар {i}", price=float(i % 4) * 100, specs={}, category_id=category.id)
+                    for i in range(11)
+                ])
+                await session.commit()
+
+            async with session_factory() as session:
+                service = ProductService(session)
+                everything = await service.get_filtered_products(ProductFilter(sort_by=sort_by, limit=100))
+
+                walked, cursor = [], None
+                while True:
+                    page = await service.get_filtered_products(
+                        ProductFilter(sort_by=sort_by, limit=3, cursor=cursor)
+                    )
+                    walked.extend(product.id for product in page["items"])
+                    cursor = page["next_cursor"]
+                    if cursor is None:
+                        break
+            return [product.id for product in everything["items"]], walked
+
+    expected, walked = asyncio.run(scenario())
+    assert len(expected) == 11
+    assert walked == expected
@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+from jose import JWTError
+from sqlalchemy import select, func
+
+from app.core.config import settings
+from app.core.security import access_token_cache
+from app.models.models import RefreshToken, User
+from app.services.token_service import TokenService
+from tests.db import requires_db, fresh_database
+
+pytestmark = requires_db
+
+
+async def _create_user(session_factory) -> int:
+    async with session_factory() as session:
+        user = User(email="user@example.com", hashed_password=None)
+        session.add(user)
+        await session.commit()
+        return user.id
+
+
+def test_refresh_rotates_token():
+    async def scenario():
+        async with fresh_database() as session_factory:
+            user_id = await _create_user(session_factory)
+            async with session_factory() as session:
+                first = await TokenService(session).issue_tokens(user_id)
+                second = await TokenService(session).refresh(first["refresh_token"])
+                third = await TokenService(session).refresh(second["refresh_token"])
+
+                families = await session.scalar(select(func.count(func.distinct(RefreshToken.family_id))))
+            return first, second, third, families
+
+    first, second, third, families = asyncio.run(scenario())
+    assert len({first["refresh_token"], second["refresh_token"], third["refresh_token"]}) == 3
+    # Все обмены - одна цепочка ротации
+    assert families == 1
+
+
+def test_concurrent_refresh_has_one_winner(monkeypatch):
+    monkeypatch.setattr(settings, "REFRESH_TOKEN_REUSE_GRACE", 10)
+
+    async def scenario():
+        async with fresh_database() as session_factory:
+            user_id = await _create_user(session_factory)
+            async with session_factory() as session:
+                issued = await TokenService(session).issue_tokens(user_id)
+
+            async def attempt():
+                async with session_factory() as session:
+                    try:
+                        return await TokenService(session).refresh(issued["refresh_token"])
+                    except ValueError:
+                        return None
+
+            results = await asyncio.gather(*(attempt() for _ in range(5)))
+            winners = [r for r in results if r is not None]
+
+            # Проигравшие попали в окно параллельного обновления: пара победителя действует
+            async with session_factory() as session:
+                renewed = await TokenService(session).refresh(winners[0]["refresh_token"])
+            return winners, renewed
+
+    winners, renewed = asyncio.run(scenario())
+    assert len(winners) == 1
+    assert renewed["refresh_token"]
+
+
+def test_reuse_after_grace_revokes_family(monkeypatch):
+    monkeypatch.setattr(settings, "REFRESH_TOKEN_REUSE_GRACE", 0)
+
+    async def scenario():
+        async with fresh_database() as session_factory:
+            user_id = await _create_user(session_factory)
+            async with session_factory() as session:
+                service = TokenService(session)
+                stolen = await service.issue_tokens(user_id)
+                legit = await service.refresh(stolen["refresh_token"])
+
+                # Повтор уже обмененного токена - признак кражи
+                with pytest.raises(ValueError):
+                    await service.refresh(stolen["refresh_token"])
+                # Отозвана вся цепочка, включая токен законного владельца
+                with pytest.raises(ValueError):
+                    await service.refresh(legit["refresh_token"])
+                # И выданные до этого access-токены
+                with pytest.raises(JWTError):
+                    await access_token_cache.decode(legit["access_token"])
+
+                revoked = await session.scalar(
+                    select(func.count()).select_from(RefreshToken).where(RefreshToken.revoked_at.is_not(None))
+                )
+            return revoked
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_unknown_token_is_rejected():
+    async def scenario():
+        async with fresh_database() as session_factory:
+            async with session_factory() as session:
+                with pytest.raises(ValueError):
+                    await TokenService(session).refresh("not-a-token")
+
+    asyncio.run(scenario())
+
+
+def test_logout_revokes_family():
+    async def scenario():
+        async with fresh_database() as session_factory:
+            user_id = await _create_user(session_factory)
+            async with session_factory() as session:
+                service = TokenService(session)
+                issued = await service.issue_tokens(user_id)
+                await service.revoke(issued["refresh_token"])
+                with pytest.raises(ValueError):
+                    await service.refresh(issued["refresh_token"])
+
+    asyncio.run(scenario())
+
+
+def test_purge_keeps_used_tokens_until_expiry():
+    async def scenario():
+        async with fresh_database() as session_factory:
+            user_id = await _create_user(session_factory)
+            async with session_factory() as session:
+                service = TokenService(session)
+                issued = await service.issue_tokens(user_id)
+                await service.refresh(issued["refresh_token"])
+                purged = await service.purge_expired()
+                left = await session.scalar(select(func.count()).select_from(RefreshToken))
+            return purged, left
+
+    # Использованный токен нужен для распознавания повторов - не удаляется
+    assert asyncio.run(scenario()) == (0, 2)